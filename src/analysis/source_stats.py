@@ -0,0 +1,447 @@
+"""Source code statistics computed in process, with the same report schema as reducto.
+
+Each python file is reduced to its FileStats, and the stats of the files of a
+package are aggregated to a report like the ones read by
+rp.read_reducto_report:
+
+{'click': {'lines': 9918, 'source_lines': 6425, 'blank_lines': 1518,
+ 'docstring_lines': 1479, 'comment_lines': 496, 'average_function_length': 11,
+ 'number_of_functions': 469, 'source_files': 17}}
+
+Every line of a file is counted once, as docstring, comment, blank or source
+(in that order of precedence), so lines = source + blank + docstring + comment
+lines, like in the reducto reports.
+
+Each file is read with a single tokenize pass (no ast), see file_stats. The
+reports can be compared against the ones of reducto with make_dataset
+cross-check.
+
+The stats of the files can be memoized by their content (see stats_cache), so
+the files vendored by many packages, or unchanged between versions, are only
+tokenized once.
+"""
+
+import ast
+import io
+import pathlib
+import tokenize
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union
+)
+
+import src.analysis.stats_cache as sc
+import src.data.download as dwn
+
+
+Report = Dict[str, Dict[str, int]]
+
+# Tokens that don't make a line count as source.
+NON_CODE_TOKENS = frozenset({
+    tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+    tokenize.DEDENT, tokenize.ENDMARKER, tokenize.ENCODING
+})
+# Directories of an sdist which are not part of the package.
+NON_PACKAGE_DIRS = frozenset({
+    'test', 'tests', 'testing', 'doc', 'docs', 'example', 'examples',
+    'benchmark', 'benchmarks', 'scripts', 'tools', 'ci', '.github'
+})
+# Scripts at the root of an sdist which are not part of the package.
+ROOT_SCRIPTS = frozenset({'setup.py', 'conftest.py', 'noxfile.py', 'fabfile.py'})
+# Version of file_stats, to be increased when its counts change, so the entries
+# of the stats cache computed by the previous version are not used.
+FILE_STATS_VERSION = 2
+# Files looked up at once in the cache by files_stats.
+FILES_BATCH = 500
+
+
+class FileStats(NamedTuple):
+    """Counts of a single python file. """
+    lines: int = 0
+    source_lines: int = 0
+    blank_lines: int = 0
+    docstring_lines: int = 0
+    comment_lines: int = 0
+    number_of_functions: int = 0
+    function_lines: int = 0  # Sum of the length of the functions.
+
+
+# Tokens starting a new logical line after them.
+STATEMENT_BOUNDARIES = frozenset({
+    tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENCODING
+})
+
+
+def _is_docstring(tokens: List[tokenize.TokenInfo]) -> bool:
+    """Whether a statement is only a (str) string, f-strings and bytes are not. """
+    for token in tokens:
+        if token.type != tokenize.STRING:
+            return False
+        prefix = token.string[:token.string.index(token.string[-1])].lower()
+        if 'f' in prefix or 'b' in prefix:
+            return False
+    return bool(tokens)
+
+
+def _header_colon(statement: List[tokenize.TokenInfo]) -> int:
+    """Index of the colon ending a def/class header, outside the brackets. """
+    level = 0
+    for index, token in enumerate(statement):
+        if token.string in ('(', '[', '{'):
+            level += 1
+        elif token.string in (')', ']', '}'):
+            level -= 1
+        elif token.string == ':' and level == 0:
+            return index
+    return len(statement) - 1
+
+
+class _Function(NamedTuple):
+    """Function whose body hasn't ended yet, found by file_stats. """
+    start: int  # Line of the def.
+    depth: int  # Indentation level of the def.
+
+
+class _TokenWalker:
+    """Lines of code, comments and docstrings, and the length of the functions
+    of a file, found on its token stream (see file_stats).
+    """
+    def __init__(self):
+        self.code_lines: Set[int] = set()
+        self.comment_lines: Set[int] = set()
+        self.docstrings: Set[int] = set()
+        self.functions: List[int] = []  # Length of every function.
+
+        self.open_functions: List[_Function] = []
+        self.depth = 0  # Indentation level.
+        self.last_code_line = 0
+        self.statement: List[tokenize.TokenInfo] = []  # Code tokens of the logical line.
+        self.at_statement_start = True
+        self.expect_docstring = True  # The current statement opens a body.
+        self.awaiting_body = False  # After a def/class header, until its body starts.
+
+    def walk(self, tokens: Iterable[tokenize.TokenInfo]) -> None:
+        for token in tokens:
+            kind = token.type
+            if kind == tokenize.COMMENT:
+                self.comment_lines.add(token.start[0])
+                continue
+            if kind == tokenize.NL:
+                continue
+            if kind == tokenize.INDENT:
+                self.depth += 1
+                self.expect_docstring = self.awaiting_body
+            elif kind == tokenize.DEDENT:
+                self.depth -= 1
+                self.close_functions(self.depth)
+            elif kind == tokenize.NEWLINE:
+                self.end_statement()
+            elif kind == tokenize.ENDMARKER:
+                self.close_functions(0)
+            elif kind not in NON_CODE_TOKENS:
+                self.add_code(token)
+            self.at_statement_start = kind in STATEMENT_BOUNDARIES
+
+    def close_functions(self, depth: int) -> None:
+        """Close the functions defined at the indentation level or deeper. """
+        while self.open_functions and self.open_functions[-1].depth >= depth:
+            start = self.open_functions.pop().start
+            self.functions.append(self.last_code_line - start + 1)
+
+    def add_code(self, token: tokenize.TokenInfo) -> None:
+        if self.at_statement_start:
+            is_string = token.type == tokenize.STRING
+            self.expect_docstring = self.expect_docstring and is_string
+            self.awaiting_body = False
+        # def is a keyword, only found opening a (maybe async) def.
+        if token.type == tokenize.NAME and token.string == 'def':
+            self.open_functions.append(_Function(token.start[0], self.depth))
+        self.statement.append(token)
+        self.code_lines.update(range(token.start[0], token.end[0] + 1))
+        self.last_code_line = token.end[0]
+
+    def end_statement(self) -> None:
+        statement, self.statement = self.statement, []
+        if not statement:
+            return
+        names = [t.string for t in statement[:2]]
+        is_def = names[:1] == ['def'] or names == ['async', 'def']
+        body = statement
+        if is_def or names[:1] == ['class']:
+            # The body starts on the next line, unless it's on the same one
+            # (def f(): pass).
+            body = statement[_header_colon(statement) + 1:]
+            self.awaiting_body = not body
+            self.expect_docstring = True
+        if self.expect_docstring and _is_docstring(body):
+            self.docstrings.update(range(body[0].start[0], body[-1].end[0] + 1))
+        if is_def and not self.awaiting_body:
+            # The whole function is on the line of the def.
+            self.close_functions(self.open_functions[-1].depth)
+        self.expect_docstring = False
+
+
+def file_stats(source: bytes) -> Optional[FileStats]:
+    """Compute the stats of a python file.
+
+    The file is read with a single tokenize pass. The docstrings (a string
+    statement opening a module, class or function body) and the spans of the
+    functions (from the def to the last line of its body) are found on the
+    token stream, without walking the ast.
+
+    Parameters
+    ----------
+    source : bytes
+        Content of the file.
+
+    Returns
+    -------
+    stats : FileStats or None
+        None when the file isn't valid python 3, reducto skips those files
+        too. Code that tokenizes but doesn't parse (i.e. python 2 print
+        statements) is rejected by compiling it to an ast.
+
+    Examples
+    --------
+    >>> file_stats(b"def f():\\n    'Doc.'\\n    # comment\\n\\n    return 1\\n")
+    FileStats(lines=5, source_lines=2, blank_lines=1, docstring_lines=1,...
+    """
+    walker = _TokenWalker()
+    try:
+        walker.walk(tokenize.tokenize(io.BytesIO(source).readline))
+        compile(source, '<file_stats>', 'exec', ast.PyCF_ONLY_AST)
+    except (SyntaxError, ValueError, tokenize.TokenError):
+        return
+    return _count_lines(source, walker)
+
+
+def _count_lines(source: bytes, walker: _TokenWalker) -> FileStats:
+    text_lines = source.splitlines()
+    blank = docstring = comment = 0
+    for number, line in enumerate(text_lines, 1):
+        if number in walker.docstrings:
+            docstring += 1
+        elif number in walker.code_lines:
+            continue
+        elif number in walker.comment_lines:
+            comment += 1
+        elif not line.strip():
+            blank += 1
+
+    lines = len(text_lines)
+    return FileStats(
+        lines=lines,
+        source_lines=lines - blank - docstring - comment,
+        blank_lines=blank,
+        docstring_lines=docstring,
+        comment_lines=comment,
+        number_of_functions=len(walker.functions),
+        function_lines=sum(walker.functions)
+    )
+
+
+def files_stats(
+        contents: Iterable[bytes],
+        cache: Optional[sc.StatsCache] = None
+) -> List[FileStats]:
+    """Compute the stats of many files, reading them from the cache if given.
+
+    Parameters
+    ----------
+    contents : Iterable[bytes]
+        Content of each file.
+    cache : sc.StatsCache, optional
+        Cache of the stats by the hash of the content. The files found are not
+        tokenized, and the stats of the rest are added to it.
+
+    Returns
+    -------
+    stats : List[FileStats]
+        Stats of the files which could be tokenized.
+    """
+    if cache is None:
+        stats = (file_stats(content) for content in contents)
+        return [stat for stat in stats if stat is not None]
+
+    # The files are hashed as they are read, and looked up in batches, so only
+    # the contents of a batch are held in memory.
+    stats: List[FileStats] = []
+    known: Dict[str, sc.Counts] = {}
+
+    def add(batch: List[Tuple[str, bytes]]) -> None:
+        known.update(cache.get_many(key for key, _ in batch if key not in known))
+        computed: Dict[str, sc.Counts] = {}
+        for key, content in batch:
+            if key not in known and key not in computed:
+                stat = file_stats(content)
+                computed[key] = None if stat is None else tuple(stat)
+        cache.put_many(computed)
+        known.update(computed)
+        # A file present more than once in a package counts every time.
+        stats.extend(FileStats(*known[key]) for key, _ in batch if known[key] is not None)
+
+    batch: List[Tuple[str, bytes]] = []
+    for content in contents:
+        batch.append((sc.content_hash(content, FILE_STATS_VERSION), content))
+        if len(batch) == FILES_BATCH:
+            add(batch)
+            batch = []
+    if batch:
+        add(batch)
+    return stats
+
+
+def package_report(name: str, files: Iterable[FileStats]) -> Report:
+    """Aggregate the stats of the files of a package to a reducto like report.
+
+    Parameters
+    ----------
+    name : str
+        Name of the package, the key of the report.
+    files : Iterable[FileStats]
+        Stats of each file.
+
+    Returns
+    -------
+    report : Report
+    """
+    total = [0] * len(FileStats._fields)
+    source_files = 0
+    for stats in files:
+        source_files += 1
+        total = [a + b for a, b in zip(total, stats)]
+    total = FileStats(*total)
+
+    average = 0
+    if total.number_of_functions:
+        average = total.function_lines / total.number_of_functions
+    return {
+        name: {
+            'lines': total.lines,
+            'source_lines': total.source_lines,
+            'blank_lines': total.blank_lines,
+            'docstring_lines': total.docstring_lines,
+            'comment_lines': total.comment_lines,
+            'average_function_length': round(average),
+            'number_of_functions': total.number_of_functions,
+            'source_files': source_files
+        }
+    }
+
+
+def _package_members(members: Dict[str, bytes]) -> Dict[str, bytes]:
+    """Keep the python members of an archive which belong to the importable packages.
+
+    The packages are found with the top_level.txt of the metadata (egg-info in
+    an sdist, dist-info in a wheel) when present. Otherwise the files in
+    directories like tests or docs, and the scripts at the root of an sdist
+    (setup.py...) are left out.
+    """
+    paths = {name: pathlib.PurePosixPath(name).parts for name in members}
+    # Every member of an sdist is inside a <name>-<version> folder.
+    roots = {path[0] for path in paths.values()}
+    is_sdist = len(roots) == 1 and all(len(path) > 1 for path in paths.values())
+    if is_sdist:
+        paths = {name: path[1:] for name, path in paths.items()}
+
+    top_level: Optional[Set[str]] = None
+    for name, path in paths.items():
+        if (
+            len(path) > 1
+            and path[-1] == 'top_level.txt'
+            and path[-2].endswith(('.egg-info', '.dist-info'))
+        ):
+            top_level = set(members[name].decode(errors='ignore').split())
+
+    kept: Dict[str, bytes] = {}
+    for name, path in paths.items():
+        if not path[-1].endswith('.py'):
+            continue
+        if path[0].endswith(('.dist-info', '.data', '.egg-info')):
+            continue
+        # The packages may be inside a src folder.
+        if path[0] == 'src' and len(path) > 1:
+            path = path[1:]
+        module = path[0][:-len('.py')] if len(path) == 1 else path[0]
+        if top_level is not None:
+            if module not in top_level:
+                continue
+        elif len(path) == 1:
+            if is_sdist and path[0] in ROOT_SCRIPTS:
+                continue
+        elif path[0] in NON_PACKAGE_DIRS:
+            continue
+        kept[name] = members[name]
+    return kept
+
+
+def analyze_path(
+        name: str,
+        target: pathlib.Path,
+        cache: Optional[sc.StatsCache] = None
+) -> Report:
+    """Obtain the report of an installed package (directory) or module (file).
+
+    The alternative to running reducto on the target (see rp.analyze), every
+    python file inside it is passed to file_stats.
+
+    Parameters
+    ----------
+    name : str
+        Name of the package, the key of the report.
+    target : pathlib.Path
+        Package or module.
+    cache : sc.StatsCache, optional
+        Cache of the stats of the files, see files_stats.
+
+    Returns
+    -------
+    report : Report
+        Same schema as rp.analyze.
+
+    Examples
+    --------
+    >>> analyze_path('click', workspace.distributions / 'click')
+    {'click': {'lines': 9918, 'source_lines': 6425,...
+    """
+    files = [target] if target.is_file() else sorted(target.rglob('*.py'))
+    return package_report(name, files_stats((path.read_bytes() for path in files), cache))
+
+
+def analyze_archive(
+        name: str,
+        archive: Union[bytes, pathlib.Path],
+        cache: Optional[sc.StatsCache] = None
+) -> Report:
+    """Obtain the report of a package from its sdist or wheel, without extracting it.
+
+    The archive is read in memory (or from the file when a path is given), and every
+    python member of the package is passed to file_stats.
+
+    Parameters
+    ----------
+    name : str
+        Name of the package, the key of the report.
+    archive : bytes or pathlib.Path
+        Content or path of the tar/zip file.
+    cache : sc.StatsCache, optional
+        Cache of the stats of the files, see files_stats.
+
+    Returns
+    -------
+    report : Report
+        Same schema as rp.read_reducto_report.
+
+    Examples
+    --------
+    >>> analyze_archive('six', cte.RAW / 'six-1.16.0.tar.gz')
+    {'six': {'lines': 1003, 'source_lines': 712,...
+    """
+    members = _package_members(dict(dwn.iter_python_members(archive)))
+    return package_report(name, files_stats(members.values(), cache))
@@ -0,0 +1,149 @@
+"""Content addressed cache of the stats of single python files.
+
+Many packages vendor the same files (six.py, the copies of urllib3 inside pip
+or botocore, typing_extensions...), and most files don't change between the
+versions of a package. The stats of every file are stored by the blake2 hash of
+its content, so source_stats only tokenizes the files it hasn't seen before:
+
+    blake2b(content) -> (lines, source_lines, blank_lines, docstring_lines,
+                         comment_lines, number_of_functions, function_lines)
+
+The counts are stored in sqlite along with the last access of each entry, the
+least recently used are removed when the cache grows over its number of
+entries. The files that can't be tokenized are stored too, without counts.
+"""
+
+import hashlib
+import pathlib
+import time
+from typing import (
+    Dict,
+    Iterable,
+    Optional,
+    Tuple
+)
+
+import src.constants as cte
+import src.data.sqlite_lru as lru
+
+
+Counts = Optional[Tuple[int, ...]]  # None for the files that can't be tokenized.
+
+# Columns of the counts, same order as source_stats.FileStats.
+COUNT_COLUMNS = (
+    'lines', 'source_lines', 'blank_lines', 'docstring_lines', 'comment_lines',
+    'number_of_functions', 'function_lines'
+)
+
+
+def content_hash(content: bytes, version: int) -> str:
+    """blake2 hash of the content of a file.
+
+    The version of the stats is part of the hash, so the entries stored by a
+    previous version of source_stats.file_stats are never read.
+    """
+    return hashlib.blake2b(
+        content, digest_size=20, person=f'file_stats.v{version}'.encode()
+    ).hexdigest()
+
+
+class StatsCache(lru.SQLiteLRU):
+    """Stats of python files by the hash of their content.
+
+    Examples
+    --------
+    >>> cache = StatsCache()
+    >>> key = content_hash(content, 1)
+    >>> cached = cache.get_many([key])
+    >>> if key not in cached:
+    ...     cache.put_many({key: tuple(ss.file_stats(content))})
+    """
+    TABLE = 'file_stats'
+    KEY = 'hash'
+    COLUMNS = ", ".join(f"{column} INTEGER" for column in COUNT_COLUMNS)
+    SIZE = None  # The budget is of entries.
+
+    def __init__(
+            self,
+            path: pathlib.Path = cte.STATS_CACHE,
+            max_entries: int = 2_000_000
+    ):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            SQLite file of the cache. Defaults to cte.STATS_CACHE.
+        max_entries : int
+            Number of files kept, the least recently used are removed when
+            exceeded. Defaults to 2 million (around 200 MB).
+        """
+        self.path = pathlib.Path(path)
+        self.max_entries = max_entries
+        super().__init__(self.path)
+        # Upper bound of the entries, to avoid counting them on every insert.
+        self._entries = len(self)
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.path})"
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Counts]:
+        """Obtain the stats of the files stored, marking them as recently used.
+
+        Parameters
+        ----------
+        hashes : Iterable[str]
+            Hashes of the files, see content_hash.
+
+        Returns
+        -------
+        found : Dict[str, Counts]
+            Counts of the hashes stored, the rest are missing.
+        """
+        hashes = list(set(hashes))
+        found: Dict[str, Counts] = {}
+        with self._lock, self._connection:
+            # Under the default limit of variables of a query (999).
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                marks = ", ".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT hash, {', '.join(COUNT_COLUMNS)} FROM file_stats "
+                    f"WHERE hash IN ({marks})",
+                    chunk
+                ).fetchall()
+                for key, *counts in rows:
+                    found[key] = None if counts[0] is None else tuple(counts)
+            self._touch(found, time.time())
+        return found
+
+    def put_many(self, entries: Dict[str, Counts]) -> None:
+        """Store the stats of files, removing the least recently used entries
+        when over max_entries (a tenth more than needed, to evict in batches).
+        """
+        if not entries:
+            return
+        now = time.time()
+        empty = (None,) * len(COUNT_COLUMNS)
+        rows = [
+            (key, *(empty if counts is None else counts), now)
+            for key, counts in entries.items()
+        ]
+        columns = ", ".join(("hash",) + COUNT_COLUMNS + ("accessed",))
+        marks = ", ".join("?" * (len(COUNT_COLUMNS) + 2))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO file_stats ({columns}) VALUES ({marks})", rows
+            )
+            self._entries += len(rows)
+            if self._entries > self.max_entries:
+                self._entries = self._evict(
+                    self.max_entries, slack=self.max_entries // 10
+                )
+
+
+_default_cache = lru.per_process(StatsCache)
+
+
+def default_cache() -> StatsCache:
+    """Cache at cte.STATS_CACHE shared inside the current process. """
+    return _default_cache()
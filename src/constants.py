@@ -1,6 +1,7 @@
 """References to constant variables. """
 
 import pathlib
+from typing import Optional
 
 # Data folders paths
 # DATA_FOLDER: pathlib.Path = pathlib.Path(".").resolve() / 'data'
@@ -11,14 +12,27 @@ DISTRIBUTIONS: pathlib.Path = INTERIM / 'distributions'
 REDUCTO_REPORTS: pathlib.Path = INTERIM / 'reducto_reports'
 PROCESSED: pathlib.Path = DATA_FOLDER / 'processed'
 RAW: pathlib.Path = DATA_FOLDER / 'raw'
+# Root of the per package workspaces, tmpfs when available (None means the
+# default temporary directory).
+SCRATCH: Optional[pathlib.Path] = (
+    pathlib.Path('/dev/shm') if pathlib.Path('/dev/shm').is_dir() else None
+)
 
 # Database path for reducto
-DB_PATH: pathlib.Path = PROCESSED / 'db.json'
+DB_PATH: pathlib.Path = PROCESSED / 'db.sqlite'
+# Previous TinyDB database for reducto, see db.migrate_tinydb
+DB_JSON_PATH: pathlib.Path = PROCESSED / 'db.json'
+# Cache of the PyPI JSON metadata
+METADATA_CACHE: pathlib.Path = EXTERNAL / 'pypi_metadata.sqlite'
+# Store of the downloaded wheels and sdists, see artifact_store
+ARTIFACTS: pathlib.Path = EXTERNAL / 'artifacts'
+# Stats of the python files by the hash of their content, see stats_cache
+STATS_CACHE: pathlib.Path = INTERIM / 'file_stats.sqlite'
 # Database path for libraries.io info
 DB_LIBRARIES_PATH: pathlib.Path = PROCESSED / 'db_libraries.json'
 
 # Reducto table
-REDUCTO_TABLE = pathlib.Path = PROCESSED / 'reducto_reports.csv'
+REDUCTO_TABLE: pathlib.Path = PROCESSED / 'reducto_reports.csv'
 
-REDUCTO_TABLE_ROOT = pathlib.Path = DATA_FOLDER.parent / 'reducto_reports.csv'
-DOWNLOADS_PER_PACKAGE_ROOT = pathlib.Path = DATA_FOLDER.parent / 'downloads_per_package.json'
+REDUCTO_TABLE_ROOT: pathlib.Path = DATA_FOLDER.parent / 'reducto_reports.csv'
+DOWNLOADS_PER_PACKAGE_ROOT: pathlib.Path = DATA_FOLDER.parent / 'downloads_per_package.json'
@@ -0,0 +1,154 @@
+"""Content addressed store of the downloaded release files (wheels and sdists).
+
+Every file is stored once by its sha256, as found in the PyPI metadata:
+
+    data/external/artifacts/ab/ab12...ef/click-8.0.3-py3-none-any.whl
+
+along with an index (sqlite) of the package name, version, size and last access
+of each file. The least recently used files are removed when the store grows
+over its size budget.
+
+The files are written by dwn.fetch_artifact, which checks the store before
+downloading anything.
+"""
+
+import pathlib
+import shutil
+import time
+from typing import (
+    List,
+    Optional
+)
+
+import src.constants as cte
+import src.data.sqlite_lru as lru
+
+
+class ArtifactStore(lru.SQLiteLRU):
+    """Store of release files by sha256.
+
+    Examples
+    --------
+    >>> store = ArtifactStore()
+    >>> path = store.get(sha256)
+    >>> if path is None:
+    ...     path = dwn.download_file(url, store.path(sha256, filename), sha256)
+    ...     store.add('click', '8.0.3', filename, sha256)
+    """
+    TABLE = 'artifacts'
+    KEY = 'sha256'
+    COLUMNS = (
+        'name TEXT NOT NULL, version TEXT, filename TEXT NOT NULL, size INTEGER NOT NULL'
+    )
+
+    def __init__(
+            self,
+            root: pathlib.Path = cte.ARTIFACTS,
+            max_bytes: int = 20 * 1024 ** 3
+    ):
+        """
+        Parameters
+        ----------
+        root : pathlib.Path
+            Directory of the store. Defaults to cte.ARTIFACTS.
+        max_bytes : int
+            Size budget of the files stored, the least recently used are
+            removed when exceeded. Defaults to 20 GB.
+        """
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        super().__init__(self.root / 'index.sqlite')
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.root})"
+
+    @property
+    def size(self) -> int:
+        """Bytes stored. """
+        with self._lock:
+            return self._total()
+
+    def path(self, sha256: str, filename: str) -> pathlib.Path:
+        """Path where a file is (or would be) stored. """
+        return self.root / sha256[:2] / sha256 / filename
+
+    def get(self, sha256: str) -> Optional[pathlib.Path]:
+        """Obtain the path of a stored file, marking it as recently used.
+
+        Parameters
+        ----------
+        sha256 : str
+            sha256 (hex digest) of the file.
+
+        Returns
+        -------
+        path : pathlib.Path or None
+            None if the file is not stored.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT filename FROM artifacts WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row is None:
+                return
+            path = self.path(sha256, row[0])
+            if not path.is_file():
+                # Removed from outside the store.
+                self._remove([sha256])
+                return
+            self._touch([sha256], time.time())
+        return path
+
+    def add(
+            self,
+            name: str,
+            version: Optional[str],
+            filename: str,
+            sha256: str
+    ) -> pathlib.Path:
+        """Register a file already written to self.path(sha256, filename).
+
+        Parameters
+        ----------
+        name : str
+            Name of the package.
+        version : str, optional
+            Version of the release.
+        filename : str
+            Name of the file.
+        sha256 : str
+            sha256 (hex digest) of the file, it's expected to be verified.
+
+        Returns
+        -------
+        path : pathlib.Path
+        """
+        path = self.path(sha256, filename)
+        size = path.stat().st_size
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO artifacts "
+                "(sha256, name, version, filename, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, name, version, filename, size, time.time())
+            )
+            self._evict(self.max_bytes, keep=sha256)
+        return path
+
+    def discard(self, sha256: str) -> None:
+        """Remove a file from the store. """
+        with self._lock, self._connection:
+            self._remove([sha256])
+
+    def _remove(self, hashes: List[str]) -> None:
+        super()._remove(hashes)
+        for sha256 in hashes:
+            shutil.rmtree(self.root / sha256[:2] / sha256, ignore_errors=True)
+
+
+_default_store = lru.per_process(ArtifactStore)
+
+
+def default_store() -> ArtifactStore:
+    """Store at cte.ARTIFACTS shared inside the current process. """
+    return _default_store()
@@ -1,68 +1,795 @@
 """Deal with data content.
 
+The reducto tables are kept by DBStore on a pluggable storage: SQLiteStorage
+(the default, indexed by package name) or TinyDBStorage (the original db.json).
 """
+import collections
+import contextlib
+import json
+import logging
+import os
 import pathlib
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
 from typing import (
+    Any,
+    Callable,
     Dict,
+    IO,
+    Iterable,
+    Iterator,
     List,
     Optional,
+    Set,
+    Tuple,
     Union
 )
 
 import tinydb
-from tinydb import TinyDB, Query
+from tinydb import TinyDB
+from tinydb.middlewares import CachingMiddleware
 
 import src.constants as cte
 
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 Report = Dict[str, Dict[str, int]]
+Document = Dict[str, Any]
+# Identifier of a document inside its table, depends on the storage.
+DocId = Union[int, str]
+
+
+class Storage:
+    """Interface of the storages where DBStore keeps its tables.
+
+    Every document stored has a 'name' field with the name of the package,
+    the remaining fields depend on the table.
+    """
+    def insert(self, table: str, document: Document) -> DocId:
+        """Insert a document in a table and return its id. """
+        raise NotImplementedError
+
+    def insert_many(self, table: str, documents: Iterable[Document]) -> List[DocId]:
+        """Insert a batch of documents in a table and return their ids. """
+        return [self.insert(table, document) for document in documents]
+
+    def update_many(self, table: str, documents: Dict[DocId, Document]) -> None:
+        """Replace the documents with the given ids. """
+        raise NotImplementedError
+
+    def all(self, table: str) -> List[Document]:
+        """Returns every document in a table. """
+        raise NotImplementedError
+
+    def index(self, table: str) -> Dict[str, DocId]:
+        """Returns the id of the documents of a table by name. When a name
+        is repeated the last document inserted is the one kept.
+        """
+        raise NotImplementedError
+
+    def get(self, table: str, doc_ids: Iterable[DocId]) -> List[Document]:
+        """Returns the documents of a table with the given ids. """
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group the writes done inside the context. """
+        yield
+
+    def close(self) -> None:
+        pass
+
+
+class Table:
+    """View over a table of a Storage, mimics the parts of tinydb.table.Table
+    used in this project.
+    """
+    def __init__(self, storage: Storage, name: str):
+        self._storage = storage
+        self.name = name
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.name!r})"
+
+    def __len__(self) -> int:
+        return len(self.all())
+
+    def all(self) -> List[Document]:
+        return self._storage.all(self.name)
+
+
+class AtomicJSONStorage(tinydb.storages.Storage):
+    """TinyDB storage writing the json to a temporary file which is then renamed
+    over the db, so an interrupted write never leaves the file half written.
+    """
+    def __init__(self, path: pathlib.Path, **kwargs):
+        self._path = pathlib.Path(path)
+        self.kwargs = kwargs
+
+    def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not self._path.is_file() or self._path.stat().st_size == 0:
+            return
+        with open(self._path, 'r') as f:
+            return json.load(f)
+
+    def write(self, data: Dict[str, Dict[str, Any]]) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self._path.parent, prefix=self._path.name)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **self.kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+
+class WriteCache(CachingMiddleware):
+    """Keeps the writes in memory until flushed by TinyDBStorage. """
+    WRITE_CACHE_SIZE = sys.maxsize
+
+
+class TinyDBStorage(Storage):
+    """Storage on a TinyDB json file.
+
+    Every write rewrites the whole file, kept for the existing db.json files.
+    The writes done inside transaction() are written at once.
+    """
+    def __init__(self, dbpath: pathlib.Path):
+        """
+        Parameters
+        ----------
+        dbpath : pathlib.Path
+            path pointing to json file.
+        """
+        self._db = TinyDB(
+            dbpath, storage=WriteCache(AtomicJSONStorage), sort_keys=True, indent=4
+        )
+        self._depth = 0
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self._db})"
+
+    @property
+    def db(self) -> TinyDB:
+        return self._db
+
+    def insert(self, table: str, document: Document) -> DocId:
+        with self.transaction():
+            return self.db.table(table).insert(document)
+
+    def insert_many(self, table: str, documents: Iterable[Document]) -> List[DocId]:
+        with self.transaction():
+            return self.db.table(table).insert_multiple(documents)
+
+    def update_many(self, table: str, documents: Dict[DocId, Document]) -> None:
+        tinydb_table = self.db.table(table)
+
+        def replace(document: Document) -> Callable[[Document], None]:
+            def transform(stored: Document) -> None:
+                stored.clear()
+                stored.update(document)
+            return transform
+
+        with self.transaction():
+            for doc_id, document in documents.items():
+                tinydb_table.update(replace(document), doc_ids=[doc_id])
+
+    def all(self, table: str) -> List[Document]:
+        return self.db.table(table).all()
+
+    def index(self, table: str) -> Dict[str, DocId]:
+        documents = sorted(self.all(table), key=lambda document: document.doc_id)
+        return {document["name"]: document.doc_id for document in documents}
+
+    def get(self, table: str, doc_ids: Iterable[DocId]) -> List[Document]:
+        tinydb_table = self.db.table(table)
+        return [tinydb_table.get(doc_id=doc_id) for doc_id in doc_ids]
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Write the file once when the outermost transaction finishes. """
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.db.storage.flush()
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SQLiteStorage(Storage):
+    """Storage on a SQLite database.
+
+    Each table has the name of the package as primary key (which is also used
+    as the id of the documents) and the document serialized as json, so
+    inserting a document with a name already present replaces it. The database
+    runs in WAL mode, and the writes done inside transaction() are committed at
+    once.
+
+    Examples
+    --------
+    >>> storage = SQLiteStorage(cte.DB_PATH)
+    >>> with storage.transaction():
+    ...     storage.insert('reducto_timing', {'name': 'click', 'time': 2.1})
+    """
+    MAX_PARAMETERS: int = 900
+
+    def __init__(self, dbpath: pathlib.Path):
+        """
+        Parameters
+        ----------
+        dbpath : pathlib.Path
+            path pointing to the sqlite file.
+        """
+        self._dbpath = dbpath
+        # Transactions are handled explicitly in transaction().
+        self._connection = sqlite3.connect(str(dbpath), isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._tables = set()
+        self._depth = 0
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self._dbpath})"
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self._connection
+
+    def _table(self, table: str) -> str:
+        """Create the table if needed and return its quoted name. """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        if table not in self._tables:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                '(name TEXT PRIMARY KEY, document TEXT NOT NULL)'
+            )
+            self._tables.add(table)
+        return f'"{table}"'
+
+    def insert(self, table: str, document: Document) -> DocId:
+        return self.insert_many(table, [document])[0]
+
+    def insert_many(self, table: str, documents: Iterable[Document]) -> List[DocId]:
+        query = (
+            f"INSERT INTO {self._table(table)} (name, document) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET document = excluded.document"
+        )
+        rows = [(doc["name"], json.dumps(doc, sort_keys=True)) for doc in documents]
+        with self.transaction():
+            self.connection.executemany(query, rows)
+        return [name for name, _ in rows]
+
+    def update_many(self, table: str, documents: Dict[DocId, Document]) -> None:
+        # The id is the name, so inserting replaces the documents.
+        self.insert_many(table, documents.values())
+
+    def all(self, table: str) -> List[Document]:
+        cursor = self.connection.execute(
+            f"SELECT document FROM {self._table(table)} ORDER BY rowid"
+        )
+        return [json.loads(document) for document, in cursor]
+
+    def index(self, table: str) -> Dict[str, DocId]:
+        cursor = self.connection.execute(f"SELECT name FROM {self._table(table)}")
+        return {name: name for name, in cursor}
+
+    def get(self, table: str, doc_ids: Iterable[DocId]) -> List[Document]:
+        doc_ids = list(doc_ids)
+        documents: Dict[str, Document] = {}
+        # Keep below the maximum number of parameters of a query.
+        for i in range(0, len(doc_ids), self.MAX_PARAMETERS):
+            chunk = doc_ids[i:i + self.MAX_PARAMETERS]
+            cursor = self.connection.execute(
+                f"SELECT name, document FROM {self._table(table)} "
+                f"WHERE name IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            documents.update((name, json.loads(document)) for name, document in cursor)
+        return [documents[doc_id] for doc_id in doc_ids]
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Run the writes inside a single transaction, nested calls join the
+        outermost one.
+        """
+        if self._depth == 0:
+            self.connection.execute("BEGIN")
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        else:
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("COMMIT")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def open_storage(dbpath: pathlib.Path) -> Storage:
+    """Choose the storage according to the extension of the file, .json files are
+    opened with TinyDB, anything else with SQLite.
+
+    A SQLite database that doesn't exist yet next to a TinyDB file with the same
+    name (db.sqlite and db.json) is created migrating it (see migrate_tinydb),
+    so the checkouts from before the move to SQLite don't start from an empty
+    database.
+    """
+    dbpath = pathlib.Path(dbpath)
+    if dbpath.suffix == '.json':
+        return TinyDBStorage(dbpath)
+    json_path = dbpath.with_suffix('.json')
+    if not dbpath.exists() and json_path.exists():
+        logger.warning(f"Migrating {json_path} to {dbpath}.")
+        # Migrated to a temporary file, so an interrupted migration is redone.
+        temporary = dbpath.with_name(dbpath.name + '.tmp')
+        temporary.unlink(missing_ok=True)
+        storage = SQLiteStorage(temporary)
+        try:
+            migrated = migrate_tinydb(json_path, storage)
+        finally:
+            storage.close()
+        os.replace(temporary, dbpath)
+        logger.warning(f"Documents migrated per table: {migrated}.")
+    return SQLiteStorage(dbpath)
+
+
+def migrate_tinydb(
+        json_path: pathlib.Path = cte.DB_JSON_PATH,
+        storage: Optional[Storage] = None
+) -> Dict[str, int]:
+    """Copy every table of a TinyDB json file to another storage.
+
+    The json is read once and each table is inserted in a single transaction.
+    When a package appears more than once in a table, the last document
+    inserted is the one kept.
+
+    Parameters
+    ----------
+    json_path : pathlib.Path
+        TinyDB file to migrate. Defaults to cte.DB_JSON_PATH.
+    storage : Storage, optional
+        Destination of the documents. Defaults to SQLiteStorage(cte.DB_PATH).
+
+    Returns
+    -------
+    migrated : Dict[str, int]
+        Number of documents read per table.
+
+    Examples
+    --------
+    >>> migrate_tinydb()
+    {'reducto_reports': 3649, 'reducto_status': 4001, 'reducto_timing': 3651}
+    """
+    if storage is None:
+        storage = SQLiteStorage(cte.DB_PATH)
+
+    with open(json_path, 'r') as f:
+        content: Dict[str, Dict[str, Document]] = json.load(f)
+
+    migrated: Dict[str, int] = {}
+    with storage.transaction():
+        for table, documents in content.items():
+            ordered = sorted(documents.items(), key=lambda item: int(item[0]))
+            storage.insert_many(table, (document for _, document in ordered))
+            migrated[table] = len(ordered)
+
+    return migrated
+
+
+class _JSONStream:
+    """Incremental parser of the objects of a json file, reading chunk_size
+    characters at a time (see iter_tinydb).
+    """
+    def __init__(self, file: IO[str], chunk_size: int):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+
+    def peek(self) -> str:
+        """Next character that is not whitespace, reading more when needed. """
+        while True:
+            while (
+                self._position < len(self._buffer)
+                and self._buffer[self._position].isspace()
+            ):
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            self._buffer, self._position = self._file.read(self._chunk_size), 0
+            if not self._buffer:
+                raise ValueError(f"Unexpected end of {self._file.name}")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(
+                f"Expected {char!r} at {self._position} of {self._file.name}"
+            )
+        self._position += 1
+
+    def value(self) -> Any:
+        """Decode the value at the current position. """
+        self.peek()
+        while True:
+            try:
+                decoded, self._position = self._decoder.raw_decode(
+                    self._buffer, self._position
+                )
+                return decoded
+            except json.JSONDecodeError:
+                # The value continues in the next chunk.
+                more = self._file.read(self._chunk_size)
+                if not more:
+                    raise
+                self._buffer = self._buffer[self._position:] + more
+                self._position = 0
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object at the current position, the value of each one
+        must be consumed before the next.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self._position += 1
+            else:
+                self.expect('}')
+                return
+
+
+def iter_tinydb(
+        json_path: pathlib.Path = cte.DB_JSON_PATH,
+        chunk_size: int = 1 << 20
+) -> Iterator[Tuple[str, Iterator[Tuple[str, Document]]]]:
+    """Read the documents of a TinyDB json file one at a time.
+
+    The file ({table: {doc_id: document}}) is parsed incrementally, reading
+    chunk_size characters at a time, so only a document is held in memory
+    instead of the whole file.
+
+    Yields
+    ------
+    table, documents : Tuple[str, Iterator[Tuple[str, Document]]]
+        Every table (the empty ones too) with the doc_id and document of each
+        of its documents, in the order of the file. Like itertools.groupby,
+        the documents of a table must be read before moving to the next one.
+
+    Examples
+    --------
+    >>> for table, documents in iter_tinydb():
+    ...     for doc_id, document in documents:
+    ...         print(table, doc_id, document["name"])
+    reducto_reports 1 urllib3
+    ...
+    """
+    with open(json_path, 'r') as f:
+        stream = _JSONStream(f, chunk_size)
+        for table in stream.members():
+            documents = ((doc_id, stream.value()) for doc_id in stream.members())
+            yield table, documents
+            # Skip the documents not read.
+            collections.deque(documents, maxlen=0)
+
+
+def compact_tinydb(
+        json_path: pathlib.Path = cte.DB_JSON_PATH
+) -> Dict[str, Tuple[int, int]]:
+    """Remove the repeated documents of a TinyDB json file.
+
+    Previous runs inserted a new document each time a package was processed,
+    this keeps only the last document of each package per table. The tables
+    are deduplicated in a single pass over the documents, read one at a time
+    (see iter_tinydb), renumbering the ids, and the file is replaced atomically.
+
+    Parameters
+    ----------
+    json_path : pathlib.Path
+        TinyDB file to compact. Defaults to cte.DB_JSON_PATH.
+
+    Returns
+    -------
+    compacted : Dict[str, Tuple[int, int]]
+        Number of documents before and after per table.
+
+    Examples
+    --------
+    >>> compact_tinydb()
+    {'reducto_reports': (3650, 3649), 'reducto_status': (7720, 4001),...
+    """
+    # Last document of each package per table, by its (numeric) doc_id.
+    latest: Dict[str, Dict[str, Tuple[int, Document]]] = {}
+    read: Dict[str, int] = {}
+    for table, documents in iter_tinydb(json_path):
+        kept = latest[table] = {}
+        read[table] = 0
+        for doc_id, document in documents:
+            read[table] += 1
+            previous = kept.get(document["name"])
+            if previous is None or previous[0] < int(doc_id):
+                kept[document["name"]] = (int(doc_id), document)
+
+    content: Dict[str, Dict[str, Document]] = {}
+    compacted: Dict[str, Tuple[int, int]] = {}
+    for table, documents in latest.items():
+        # Keep the order of the last insert of each package.
+        ordered = sorted(documents.values(), key=lambda item: item[0])
+        content[table] = {
+            str(new_id): document for new_id, (_, document) in enumerate(ordered, 1)
+        }
+        compacted[table] = (read[table], len(ordered))
+
+    AtomicJSONStorage(json_path, sort_keys=True, indent=4).write(content)
+    return compacted
 
 
 class DBStore:
     """
     Deal with db interaction in this class
 
+    The id of the document of each package is indexed by name when the db is
+    opened and updated on every insert, so the getters by name don't need to
+    scan the tables. Each package has a single document per table, writing
+    it again replaces the previous one (see upsert_report, upsert_status and
+    upsert_timing).
+
     Examples
     --------
     >>> dbs = DBStore()
+    >>> dbs = DBStore(cte.DB_JSON_PATH)  # Previous TinyDB file
     """
-    def __init__(self, dbpath: pathlib.Path = cte.DB_PATH):
+    TABLES = ('reducto_reports', 'reducto_timing', 'reducto_status')
+
+    def __init__(
+            self,
+            dbpath: pathlib.Path = cte.DB_PATH,
+            storage: Optional[Storage] = None
+    ):
         """
         Parameters
         ----------
         dbpath : pathlib.Path
-            path pointing to json file.
+            path pointing to the database file. A .json file is opened with
+            TinyDB, otherwise with SQLite.
+        storage : Storage, optional
+            Storage to use instead of opening dbpath.
         """
-        self._db = TinyDB(dbpath, sort_keys=True, indent=4)
+        self._db = storage if storage is not None else open_storage(dbpath)
+        self._index: Dict[str, Dict[str, DocId]] = {
+            table: self.db.index(table) for table in self.TABLES
+        }
+
+        self._buffer: Dict[Tuple[str, str], Document] = {}
+        self._previous_handler = None
+        # Process that installed the SIGINT handler, forked children inherit it.
+        self._handler_pid: Optional[int] = None
+        self._buffering: bool = False
+        self._flush_every: int = 0
+        self._flush_interval: float = 0
+        self._last_flush: float = 0
+        self._flushing: bool = False
 
     def __repr__(self):
         return type(self).__name__ + f"({self._db})"
 
     @property
-    def db(self) -> TinyDB:
+    def db(self) -> Storage:
         return self._db
 
     @property
-    def reducto_reports_table(self) -> tinydb.database.Table:
+    def reducto_reports_table(self) -> Table:
         """Returns the table containing the reducto reports. """
-        return self.db.table('reducto_reports')
+        return Table(self.db, 'reducto_reports')
 
     @property
-    def reducto_timing_table(self) -> tinydb.database.Table:
+    def reducto_timing_table(self) -> Table:
         """Returns the table containing the reducto timing.
         Contains the time in seconds reducto took to run.
         """
-        return self.db.table('reducto_timing')
+        return Table(self.db, 'reducto_timing')
 
     @property
-    def reducto_status_table(self) -> tinydb.database.Table:
+    def reducto_status_table(self) -> Table:
         """Returns the table containing the reducto reports.
         Contains the status of the library. If was already detected, and
         in that case if worked or not.
         """
-        return self.db.table('reducto_status')
+        return Table(self.db, 'reducto_status')
 
-    def insert_reducto_report(self, name: str, report: Report) -> None:
-        """Insert a register in the corresponding table.
+    def transaction(self):
+        """Group the inserts done inside the context in a single transaction.
+
+        Examples
+        --------
+        >>> with dbs.transaction():
+        ...     dbs.upsert_timing('click', 2.1)
+        ...     dbs.upsert_status('click', True, '')
+        """
+        return self.db.transaction()
+
+    def close(self) -> None:
+        self.db.close()
+
+    @contextlib.contextmanager
+    def buffered(
+            self,
+            flush_every: int = 100,
+            flush_interval: float = 60
+    ) -> Iterator[None]:
+        """Keep the inserts in memory and write them in groups.
+
+        The inserts are written in a single transaction when flush_every
+        documents are pending, when more than flush_interval seconds passed since
+        the last write, on SIGINT and when leaving the context, so an
+        interrupted run doesn't lose the inserts pending.
+
+        Parameters
+        ----------
+        flush_every : int
+            Maximum number of documents kept in memory. Defaults to 100.
+        flush_interval : float
+            Maximum number of seconds between writes. Defaults to 60.
+
+        Examples
+        --------
+        >>> with dbs.buffered(flush_every=50):
+        ...     dbs.upsert_timing('click', 2.1)
+        ...     dbs.upsert_status('click', True, '')
+        """
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGINT, self._flush_on_sigint)
+            self._previous_handler = previous_handler
+            self._handler_pid = os.getpid()
+
+        self._buffering = True
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        try:
+            yield
+        finally:
+            self._buffering = False
+            self.flush()
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+                self._previous_handler = None
+
+    def _flush_on_sigint(self, signum, frame) -> None:
+        # A forked child has a copy of the buffer (already written or to be
+        # written by the parent) and of the connection, it must not write them.
+        if not self._flushing and os.getpid() == self._handler_pid:
+            self.flush()
+        if callable(self._previous_handler):
+            self._previous_handler(signum, frame)
+        else:
+            signal.default_int_handler(signum, frame)
+
+    def flush(self) -> None:
+        """Write the inserts pending, if any, in a single transaction. """
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+
+        self._flushing = True
+        try:
+            grouped: Dict[str, List[Document]] = {}
+            for (table, _), document in self._buffer.items():
+                grouped.setdefault(table, []).append(document)
+            with self.db.transaction():
+                for table, documents in grouped.items():
+                    self._write(table, documents)
+            self._buffer = {}
+        finally:
+            self._flushing = False
+
+    def _write(self, table: str, documents: List[Document]) -> None:
+        """Upsert documents (with unique names) and keep the index updated. """
+        index = self._index[table]
+        updated = {
+            index[doc["name"]]: doc for doc in documents if doc["name"] in index
+        }
+        inserted = [doc for doc in documents if doc["name"] not in index]
+        with self.db.transaction():
+            if updated:
+                self.db.update_many(table, updated)
+            if inserted:
+                doc_ids = self.db.insert_many(table, inserted)
+                for document, doc_id in zip(inserted, doc_ids):
+                    index[document["name"]] = doc_id
+
+    def _upsert(self, table: str, document: Document) -> None:
+        """Insert or replace the document of a package. """
+        if not self._buffering:
+            self._write(table, [document])
+            return
+
+        key = (table, document["name"])
+        # Keep the insertion order of the last version of each document.
+        self._buffer.pop(key, None)
+        self._buffer[key] = document
+        elapsed = time.monotonic() - self._last_flush
+        if len(self._buffer) >= self._flush_every or elapsed >= self._flush_interval:
+            self.flush()
+
+    def _buffer_documents(self, table: str) -> Iterator[Document]:
+        """Documents of a table pending to be written. """
+        return (
+            document for (buffered_table, _), document in self._buffer.items()
+            if buffered_table == table
+        )
+
+    def _buffered(self, table: str, name: str) -> Optional[Document]:
+        """Obtain the document of a package pending to be written. """
+        return self._buffer.get((table, name))
+
+    def _get(self, table: str, name: str) -> Optional[Document]:
+        """Obtain the document of a package using the index. """
+        document = self._buffered(table, name)
+        if document is not None:
+            return document
+        doc_id = self._index[table].get(name)
+        if doc_id is None:
+            return
+        return self.db.get(table, [doc_id])[0]
+
+    def get_many(
+            self,
+            names: Iterable[str],
+            table: str = 'reducto_reports'
+    ) -> Dict[str, Document]:
+        """Obtain the documents of multiple packages at once.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            Names of the packages.
+        table : str
+            Name of the table to read from. Defaults to 'reducto_reports'.
+
+        Returns
+        -------
+        documents : Dict[str, Document]
+            Documents by name, the packages not inserted are left out.
+
+        Examples
+        --------
+        >>> dbs.get_many(['click', 'six'], 'reducto_status')
+        {'click': {'name': 'click', 'reason': '', 'status': True},...
+        """
+        index = self._index[table]
+        names = list(dict.fromkeys(names))
+        found = [name for name in names if name in index]
+        documents = dict(zip(found, self.db.get(table, [index[name] for name in found])))
+        for name in names:
+            document = self._buffered(table, name)
+            if document is not None:
+                documents[name] = document
+        return documents
+
+    def upsert_report(self, name: str, report: Report) -> None:
+        """Insert or replace the report of a package.
 
         Parameters
         ----------
@@ -74,30 +801,48 @@ class DBStore:
         Examples
         --------
         >>> import src.data.reducto_process as rp
-        >>> report = rp.read_reducto_report('click')
-        >>> dbs.insert_reducto_reports('click', report)
+        >>> report = rp.read_reducto_report('click', workspace)
+        >>> dbs.upsert_report('click', report)
         """
-        self.reducto_status_table.insert({"name": name, "report": report})
+        self._upsert('reducto_reports', {"name": name, "report": report})
 
-    def insert_reducto_timing(self, name: str, timing: float) -> None:
-        """Insert a register in the corresponding table.
+    def upsert_timing(
+            self,
+            name: str,
+            timing: Optional[float],
+            stages: Optional[Dict[str, Dict[str, float]]] = None
+    ) -> None:
+        """Insert or replace the timing of a package.
 
         Parameters
         ----------
         name : str
             Name of the package.
-        timing : float
-            Dict with package name and seconds elapsed during the process.
+        timing : float or None
+            Seconds elapsed during the analysis, None when it failed before.
+        stages : Dict[str, Dict[str, float]], optional
+            Seconds and bytes of each stage of the process, see src.data.stages.
 
         Examples
         --------
-        >>> import src.data.reducto_process as rp
-        >>> dbs.insert_reducto_reports({'click': 2.1})
+        >>> dbs.upsert_timing('click', 2.1)
+        >>> dbs.upsert_timing('click', 2.1, {'download': {'seconds': 0.2, 'bytes': 97345}})
         """
-        self.reducto_timing_table.insert({"name": name, "time": timing})
+        timing_report = {"name": name, "time": timing}
+        if stages is not None:
+            timing_report["stages"] = stages
+        self._upsert('reducto_timing', timing_report)
 
-    def insert_reducto_status(self, name: str, status: bool, reason: str) -> None:
-        """Insert a register in the corresponding table.
+    def upsert_status(
+            self,
+            name: str,
+            status: bool,
+            reason: str,
+            strategy: Optional[str] = None,
+            version: Optional[str] = None,
+            sha256: Optional[str] = None
+    ) -> None:
+        """Insert or replace the status of a package.
 
         Parameters
         ----------
@@ -110,27 +855,40 @@ class DBStore:
             Reason if the failure, if any.
             When no failure ocurred (status is True), the reason is written as "",
             in case of failure, the reasons may be one of the following detected:
-            'reducto_error', 'find_package', 'install'
+            'reducto_error', 'reducto_name', 'find_package', 'install', 'download',
+            and 'timeout' or 'oom' when a step ran over its limits.
+        strategy : str, optional
+            Strategy of rp.resolve_package which found the package, or
+            'candidates' when found by rp.distribution_candidates.
+        version, sha256 : str, optional
+            Release analyzed (see dwn.latest_release), compared against the
+            latest one by the incremental runs of reducto_reports.
 
         Examples
         --------
-        >>> import src.data.reducto_process as rp
-        >>> dbs.insert_reducto_status({'name': 'click', 'status': True, 'reason': ''})
-        >>> dbs.insert_reducto_status({'name': 'futures', 'status': False, 'reason': ''})
+        >>> dbs.upsert_status('click', True, '')
+        >>> dbs.upsert_status('futures', False, 'install')
         """
         status_report = {
             "name": name,
             "status": status,
-            "reason": reason
+            "reason": reason,
+            "strategy": strategy,
+            "version": version,
+            "sha256": sha256
         }
 
-        self.reducto_status_table.insert(status_report)
+        self._upsert('reducto_status', status_report)
+
+    # Previous names of the upserts.
+    insert_reducto_report = upsert_report
+    insert_reducto_timing = upsert_timing
+    insert_reducto_status = upsert_status
 
     def get_reducto_report(self, name: str) -> Optional[Report]:
         """Obtain the report of a package if already inserted.
 
-        Loops through the reducto reports table checking for the name and returns the
-        whole report.
+        Looks up the name in the index and returns the whole report.
 
         Parameters
         ----------
@@ -149,16 +907,12 @@ class DBStore:
         'comment_lines': 496, 'docstring_lines': 1479, 'lines': 9918,...
         'number_of_functions': 469, 'source_files': 17, 'source_lines': 6425}}
         """
-        query = self.reducto_reports_table.search(Query().name == name)
-        if len(query) > 0:
-            return query[0]
-        else:
-            return
+        return self._get('reducto_reports', name)
 
-    def get_reducto_status(self, name: str) -> Report:
+    def get_reducto_status(self, name: str) -> Optional[Document]:
         """Obtain the status of a package if already inserted.
 
-        TODO: REVIEW DOCSTRING!
+        Looks up the name in the index and returns the status document.
 
         Parameters
         ----------
@@ -167,29 +921,58 @@ class DBStore:
 
         Returns
         -------
-        report : Report
-
-        Raises
-        ------
-        rp.PackageNameNotFound
-            If the package wasn't found.
+        status : Document or None
+            Status if found.
 
         Examples
         --------
         >>> dbs.get_reducto_status('click')
         {'name': 'click', 'reason': '', 'status': True}
         """
-        query = self.reducto_status_table.search(Query().name == name)
-        if len(query) > 0:
-            return query[0]
-        else:
-            return
+        return self._get('reducto_status', name)
+
+    def get_processed_packages(self) -> Set[str]:
+        """Returns the names of the packages processed correctly.
+
+        Reads the whole reducto_status_table at once, meant to decide which
+        packages are left before starting a run.
+
+        Examples
+        --------
+        >>> dbs.get_processed_packages()
+        {'click', 'six', 'urllib3',...
+        """
+        statuses = {status["name"]: status for status in self.reducto_status_table.all()}
+        buffered = self._buffer_documents('reducto_status')
+        statuses.update((status["name"], status) for status in buffered)
+        return {name for name, status in statuses.items() if status["status"]}
+
+    def get_analyzed_releases(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Returns the release (version and sha256) of each package processed
+        correctly, both None for the packages processed before they were
+        recorded.
+
+        Examples
+        --------
+        >>> dbs.get_analyzed_releases()
+        {'click': ('8.0.3', '410e932b050f5eed...'), 'six': (None, None),...
+        """
+        statuses = {status["name"]: status for status in self.reducto_status_table.all()}
+        buffered = self._buffer_documents('reducto_status')
+        statuses.update((status["name"], status) for status in buffered)
+        return {
+            name: (status.get("version"), status.get("sha256"))
+            for name, status in statuses.items() if status["status"]
+        }
 
     def get_failed_packages(self) -> List[Dict[str, Union[str, bool]]]:
         """Returns the packages that failed to be processed.
         Those packages with false in reducto_status_table.
         """
-        return self.reducto_reports_table.search(Query().status == False)
+        return [
+            status for status in self.reducto_status_table.all()
+            if not status["status"]
+        ]
 
 
 class DBLibraries:
@@ -2,20 +2,32 @@
 https://github.com/plaguss/syntax_test_suite
 """
 
+import fcntl
+import hashlib
+import http.client
+import io
 import json
 import os
+import shutil
 import tarfile
+import time
 import traceback
 import zipfile
 from argparse import ArgumentParser
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
-from typing import Generator, List, Literal, Optional, Tuple, Union, cast, Dict
-from urllib.request import Request, urlopen, urlretrieve
+from typing import (
+    Callable, Generator, IO, Iterator, List, Literal, NamedTuple, Optional, Tuple, Union,
+    cast, Dict
+)
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 import pathlib
 
 import src.constants as cte
+import src.data.artifact_store as ars
+import src.data.metadata_cache as mc
 
 
 PYPI_INSTANCE = "https://pypi.org/pypi"
@@ -26,13 +38,115 @@ PYPI_TOP_PACKAGES = "https://hugovk.github.io/top-pypi-packages/top-pypi-package
 PYPI_TOP_PACKAGES_LOCAL = str(cte.EXTERNAL / 'top-pypi-packages-365-days.json')
 
 ArchiveKind = Union[tarfile.TarFile, zipfile.ZipFile]
+# Files extracted along with the python sources by extract_python_sources:
+# package markers and the metadata of the distribution.
+PACKAGE_MARKERS = frozenset(
+    {'py.typed', 'PKG-INFO', 'METADATA', 'RECORD', 'top_level.txt'}
+)
 Days = Union[Literal[30], Literal[365]]
 
 
-def get_package_source(package: str, version: Optional[str] = None) -> str:
-    with urlopen(PYPI_INSTANCE + f"/{package}/json") as page:
-        metadata = json.load(page)
+def get_package_metadata(
+        package: str,
+        cache: Optional[mc.MetadataCache] = None
+) -> mc.Metadata:
+    """Obtain the (trimmed) PyPI JSON metadata of a package through the cache.
+
+    Fresh entries are returned without any request, stale ones are revalidated
+    with their ETag.
+
+    Parameters
+    ----------
+    package : str
+        Name of the package.
+    cache : mc.MetadataCache, optional
+        Defaults to the cache at cte.METADATA_CACHE.
+
+    Returns
+    -------
+    metadata : mc.Metadata
+        See mc.trim_metadata.
+    """
+    if cache is None:
+        cache = mc.default_cache()
+
+    entry = cache.get(package)
+    if entry is not None and cache.is_fresh(entry):
+        return entry.metadata
+
+    headers = {}
+    if entry is not None and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    request = Request(PYPI_INSTANCE + f"/{package}/json", headers=headers)
+    try:
+        with urlopen(request) as page:
+            metadata = mc.trim_metadata(json.load(page))
+            etag = page.headers.get('ETag')
+    except HTTPError as exc:
+        if exc.code == 304 and entry is not None:
+            cache.revalidated(package)
+            return entry.metadata
+        raise
+
+    cache.put(package, metadata, etag)
+    return metadata
+
+
+def get_package_source(
+        package: str,
+        version: Optional[str] = None,
+        cache: Optional[mc.MetadataCache] = None
+) -> str:
+    metadata = get_package_metadata(package, cache)
+    return select_source(metadata, package, version)
+
+
+def get_package_source_file(
+        package: str,
+        version: Optional[str] = None,
+        cache: Optional[mc.MetadataCache] = None
+) -> Dict:
+    """Like get_package_source, but returns the whole entry of the sdist
+    (url, filename, size and digests).
+    """
+    metadata = get_package_metadata(package, cache)
+    return select_source_file(metadata, package, version)
+
+
+def select_source(metadata: Dict, package: str, version: Optional[str] = None) -> str:
+    """Obtain the url of the sdist of a package from its PyPI JSON metadata.
+
+    See select_source_file.
+    """
+    return cast(str, select_source_file(metadata, package, version)["url"])
+
+
+def select_source_file(
+        metadata: Dict,
+        package: str,
+        version: Optional[str] = None
+) -> Dict:
+    """Obtain the entry of the sdist of a package from its PyPI JSON metadata.
+
+    Parameters
+    ----------
+    metadata : Dict
+        Content of https://pypi.org/pypi/<package>/json.
+    package : str
+        Name of the package, for the error messages.
+    version : str, optional
+        Version of the release, the latest when None.
+
+    Returns
+    -------
+    source : Dict
+        Entry of the file in the metadata (url, filename, digests...).
 
+    Raises
+    ------
+    ValueError
+        When the version or the sdist are not found.
+    """
     if version is None:
         sources = metadata["urls"]
     else:
@@ -50,7 +164,308 @@ def get_package_source(package: str, version: Optional[str] = None) -> str:
     else:
         raise ValueError(f"Couldn't find any sources for {package}")
 
-    return cast(str, source["url"])
+    return source
+
+
+def is_pure_wheel(filename: str) -> bool:
+    """Whether a wheel can be installed anywhere (python 3, no abi, any platform).
+
+    Examples
+    --------
+    >>> is_pure_wheel('click-8.0.3-py3-none-any.whl')
+    True
+    >>> is_pure_wheel('PyYAML-6.0-cp39-cp39-manylinux1_x86_64.whl')
+    False
+    """
+    if not filename.endswith('.whl'):
+        return False
+    # {distribution}-{version}(-{build})?-{python}-{abi}-{platform}.whl
+    python, abi, platform = filename[:-len('.whl')].split('-')[-3:]
+    return 'py3' in python.split('.') and abi == 'none' and platform == 'any'
+
+
+def select_wheel_file(
+        metadata: Dict,
+        package: str,
+        version: Optional[str] = None
+) -> Optional[Dict]:
+    """Obtain the entry of a pure python wheel of a package from its metadata.
+
+    Parameters
+    ----------
+    metadata : Dict
+        Content of https://pypi.org/pypi/<package>/json.
+    package : str
+        Name of the package, for the error messages.
+    version : str, optional
+        Version of the release, the latest when None.
+
+    Returns
+    -------
+    wheel : Dict or None
+        Entry of the file in the metadata, None if there is no pure wheel.
+    """
+    if version is None:
+        files = metadata["urls"]
+    elif version in metadata["releases"]:
+        files = metadata["releases"][version]
+    else:
+        raise ValueError(f"No releases found with given version ('{version}') tag.")
+
+    for file in files:
+        if file["packagetype"] == "bdist_wheel" and is_pure_wheel(file["filename"]):
+            return file
+
+
+class Release(NamedTuple):
+    """Release of a package analyzed, recorded to skip it on incremental runs. """
+    version: Optional[str]
+    sha256: Optional[str]  # Of the pure wheel, or of the sdist when there is none.
+
+
+def latest_release(metadata: Dict, package: str) -> Release:
+    """Obtain the version of the latest release of a package, and the sha256 of
+    the file analyzed from it (the pure wheel when available, like
+    rp.acquire, otherwise the sdist).
+
+    Examples
+    --------
+    >>> latest_release(get_package_metadata('click'), 'click')
+    Release(version='8.0.3', sha256='410e932b050f5eed773c4cda94de75971c89cdb...')
+    """
+    file = select_wheel_file(metadata, package)
+    if file is None:
+        try:
+            file = select_source_file(metadata, package)
+        except ValueError:
+            file = {"digests": {"sha256": None}}
+    return Release(metadata["info"]["version"], file["digests"]["sha256"])
+
+
+class ChecksumError(Exception):
+    """Error raised when a downloaded file doesn't match its sha256. """
+    def __init__(self, url: str, expected: str, obtained: str):
+        self.url = url
+        self.msg: str = f"sha256 mismatch, expected {expected} but got {obtained}"
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return f"{self.msg}: {self.url}"
+
+
+def download_file(
+        url: str,
+        destination: Path,
+        sha256: Optional[str] = None,
+        retries: int = 3,
+        chunk_size: int = 1 << 16,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None
+) -> Path:
+    """Stream a file to disk, verifying its sha256 on the fly.
+
+    The content is written to `<destination>.part`, renamed to destination once
+    complete and verified. If the download is interrupted, the next attempt
+    (or the next call) resumes the partial file with an HTTP Range request.
+    The partial file is locked while downloading, so concurrent calls for the
+    same destination wait for each other instead of writing over each other.
+
+    Parameters
+    ----------
+    url : str
+        Url of the file.
+    destination : Path
+        Final path of the file.
+    sha256 : str, optional
+        Expected sha256 (hex digest), as found in the PyPI metadata.
+    retries : int
+        Number of times the download is resumed after a connection error.
+        Defaults to 3.
+    chunk_size : int
+        Bytes read at once. Defaults to 64 KB.
+    progress : Callable[[int, Optional[int]], None], optional
+        Called after every chunk with the bytes downloaded and the total size
+        (None if unknown).
+
+    Returns
+    -------
+    destination : Path
+
+    Raises
+    ------
+    ChecksumError
+        When the file doesn't match the sha256 expected. The partial file is
+        removed.
+
+    Examples
+    --------
+    >>> source = get_package_source_file('six')
+    >>> sha256 = source['digests']['sha256']
+    >>> download_file(source['url'], cte.RAW / source['filename'], sha256)
+    PosixPath('/home/agustin/.../data/raw/six-1.16.0.tar.gz')
+    """
+    if _is_downloaded(destination, sha256):
+        return destination
+
+    part = destination.with_name(destination.name + '.part')
+    with open(part, 'ab') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Another process may have finished it while waiting for the lock.
+        if _is_downloaded(destination, sha256):
+            if part.is_file() and part.stat().st_size == 0:
+                part.unlink()
+            return destination
+
+        for attempt in range(retries + 1):
+            try:
+                digest = _download_part(url, part, chunk_size, progress)
+                break
+            except (OSError, http.client.HTTPException) as exc:
+                if isinstance(exc, HTTPError) and exc.code < 500:
+                    raise
+                if attempt == retries:
+                    raise
+                print(f"Download of {url} interrupted ({exc!r}), resuming.")
+                time.sleep(2 ** attempt)
+
+        if sha256 is not None and digest != sha256:
+            part.unlink()
+            raise ChecksumError(url, sha256, digest)
+        os.replace(part, destination)
+
+    return destination
+
+
+def _download_part(
+        url: str,
+        part: Path,
+        chunk_size: int,
+        progress: Optional[Callable[[int, Optional[int]], None]]
+) -> str:
+    """Download url to part, resuming from its current size, and return the
+    sha256 of the whole file.
+    """
+    hasher = hashlib.sha256()
+    offset = part.stat().st_size
+    if offset > 0:
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+    try:
+        response = urlopen(Request(url, headers=headers))
+    except HTTPError as exc:
+        if exc.code == 416:  # The partial file is already complete.
+            return hasher.hexdigest()
+        raise
+
+    with response:
+        if offset > 0 and response.status != 206:
+            # The server ignored the range, start over.
+            hasher = hashlib.sha256()
+            offset = 0
+        length = response.headers.get('Content-Length')
+        total = offset + int(length) if length is not None else None
+        with open(part, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                f.write(chunk)
+                hasher.update(chunk)
+                offset += len(chunk)
+                if progress is not None:
+                    progress(offset, total)
+
+    if total is not None and offset < total:
+        # The connection was closed before the end, resumed on the next attempt.
+        raise http.client.IncompleteRead(b'', total - offset)
+    return hasher.hexdigest()
+
+
+def fetch_artifact(
+        file: Dict,
+        package: str,
+        version: Optional[str] = None,
+        store: Optional[ars.ArtifactStore] = None
+) -> Path:
+    """Obtain a release file (wheel or sdist) through the artifact store.
+
+    The file is only downloaded when it's not already in the store.
+
+    Parameters
+    ----------
+    file : Dict
+        Entry of the file in the metadata, as returned by select_source_file
+        or select_wheel_file.
+    package : str
+        Name of the package.
+    version : str, optional
+        Version of the release, informative.
+    store : ars.ArtifactStore, optional
+        Defaults to the store at cte.ARTIFACTS.
+
+    Returns
+    -------
+    path : Path
+        Path of the file inside the store, it must not be modified.
+
+    Raises
+    ------
+    ValueError
+        When the entry has no sha256 to address the file.
+    """
+    store = store if store is not None else ars.default_store()
+    sha256 = file["digests"]["sha256"]
+    if sha256 is None:
+        raise ValueError(f"No sha256 found for {file['filename']}.")
+    path = store.get(sha256)
+    if path is None:
+        destination = store.path(sha256, file["filename"])
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        download_file(file["url"], destination, sha256)
+        path = store.add(package, version, file["filename"], sha256)
+    return path
+
+
+def fetch_bytes(url: str, sha256: Optional[str] = None) -> bytes:
+    """Download a file in memory, verifying its sha256.
+
+    Parameters
+    ----------
+    url : str
+        Url of the file.
+    sha256 : str, optional
+        Expected sha256 (hex digest), as found in the PyPI metadata.
+
+    Returns
+    -------
+    content : bytes
+
+    Raises
+    ------
+    ChecksumError
+        When the content doesn't match the sha256 expected.
+    """
+    with urlopen(url) as response:
+        content = response.read()
+    if sha256 is not None:
+        digest = hashlib.sha256(content).hexdigest()
+        if digest != sha256:
+            raise ChecksumError(url, sha256, digest)
+    return content
+
+
+def _is_downloaded(destination: Path, sha256: Optional[str]) -> bool:
+    if not destination.is_file():
+        return False
+    return sha256 is None or file_sha256(destination) == sha256
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 16) -> str:
+    """Obtain the sha256 (hex digest) of a file. """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 
 def get_archive_manager(local_file: str) -> ArchiveKind:
@@ -69,20 +484,153 @@ def get_first_archive_member(archive: ArchiveKind) -> str:
         return archive.namelist()[0]
 
 
+def is_python_member(name: str) -> bool:
+    """Whether a member of an archive is kept by extract_python_sources. """
+    basename = name.rsplit('/', 1)[-1]
+    return basename.endswith('.py') or basename in PACKAGE_MARKERS
+
+
+def _member_path(directory: Path, name: str) -> Optional[Path]:
+    """Path where a member is extracted, None if it would end outside directory. """
+    parts = pathlib.PurePosixPath(name).parts
+    if not parts or name.startswith('/') or '..' in parts:
+        return
+    return directory.joinpath(*parts)
+
+
+def extract_python_sources(
+        local_file: Path,
+        directory: Path,
+        max_member_size: Optional[int] = None
+) -> Path:
+    """Extract only the python files of an archive (and the package markers,
+    see PACKAGE_MARKERS).
+
+    The members are streamed one at a time (tar files are read sequentially in
+    a single pass), so tests data, docs or binaries are never written to disk.
+
+    Parameters
+    ----------
+    local_file : Path
+        tar or zip file.
+    directory : Path
+        Directory where the files are extracted.
+    max_member_size : int, optional
+        Members bigger than this number of bytes are skipped, i.e. huge
+        generated modules. No limit by default.
+
+    Returns
+    -------
+    root : Path
+        Directory of the first member of the archive, as download_and_extract.
+
+    Examples
+    --------
+    >>> extract_python_sources(cte.RAW / 'six-1.16.0.tar.gz', cte.RAW)
+    PosixPath('/home/agustin/.../data/raw/six-1.16.0')
+    """
+    first_member: Optional[str] = None
+    extracted, skipped = 0, 0
+
+    def write(name: str, size: int, content: IO[bytes]) -> None:
+        nonlocal extracted, skipped
+        target = _member_path(directory, name)
+        if (
+            target is None
+            or not is_python_member(name)
+            or (max_member_size is not None and size > max_member_size)
+        ):
+            skipped += 1
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(content, f)
+        extracted += 1
+
+    if tarfile.is_tarfile(local_file):
+        with tarfile.open(local_file, mode='r|*') as archive:
+            for member in archive:
+                first_member = first_member or member.name
+                if member.isfile():
+                    write(member.name, member.size, archive.extractfile(member))
+    elif zipfile.is_zipfile(local_file):
+        with zipfile.ZipFile(local_file) as archive:
+            for info in archive.infolist():
+                first_member = first_member or info.filename
+                if not info.is_dir():
+                    with archive.open(info) as content:
+                        write(info.filename, info.file_size, content)
+    else:
+        raise ValueError("Unknown archive kind.")
+
+    print(f"Extracted {extracted} files, skipped {skipped}.")
+    return directory / pathlib.PurePosixPath(first_member or '').parts[0]
+
+
+def iter_python_members(archive: Union[bytes, Path]) -> Iterator[Tuple[str, bytes]]:
+    """Read the python files (and package markers) of an archive in memory.
+
+    Parameters
+    ----------
+    archive : bytes or Path
+        Content of a tar or zip file, or its path (read from the file, without
+        extracting it).
+
+    Yields
+    ------
+    member : Tuple[str, bytes]
+        Name and content of each member kept, see is_python_member.
+    """
+    if isinstance(archive, bytes):
+        yield from _iter_python_members(io.BytesIO(archive))
+    else:
+        with open(archive, 'rb') as f:
+            yield from _iter_python_members(f)
+
+
+def _iter_python_members(fileobj: IO[bytes]) -> Iterator[Tuple[str, bytes]]:
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_python_member(info.filename):
+                    yield info.filename, archive.read(info)
+    else:
+        fileobj.seek(0)
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode='r|*')
+        except tarfile.ReadError as exc:
+            raise ValueError("Unknown archive kind.") from exc
+        with archive:
+            for member in archive:
+                if member.isfile() and is_python_member(member.name):
+                    yield member.name, archive.extractfile(member).read()
+
+
 def download_and_extract(
         package: str,
         directory: Path,
         version: Optional[str] = None,
-        remove_after: bool = False
+        remove_after: bool = False,
+        python_only: bool = False,
+        max_member_size: Optional[int] = None
 ) -> Path:
     """Modified to allow avoiding removing files after.
 
+    The sdist is obtained through the artifact store (see fetch_artifact).
+
     Parameters
     ----------
     package
     directory
     version
-    remove_after
+    remove_after : bool
+        Remove the sdist from the artifact store after extracting it.
+    python_only : bool
+        Extract only the python sources and package markers, see
+        extract_python_sources. Defaults to False (extracts everything).
+    max_member_size : int, optional
+        With python_only, skip the members bigger than this number of bytes.
 
     Returns
     -------
@@ -94,19 +642,23 @@ def download_and_extract(
     PosixPath('/home/agustin/github_repos/top_pypi_source_code_stats/data/raw/six-1.16.0')
     """
     try:
-        source = get_package_source(package, version)
+        metadata = get_package_metadata(package)
+        source = select_source_file(metadata, package, version)
     except ValueError:
         return None
 
     print(f"Downloading {package}.")
-    local_file, _ = urlretrieve(source, directory / f"{package}-src")
-    with get_archive_manager(local_file) as archive:
-        print(f"Extracting {package}")
-        archive.extractall(path=directory)
-        result_dir = get_first_archive_member(archive)
+    local_file = fetch_artifact(source, package, version or metadata["info"]["version"])
+    print(f"Extracting {package}")
+    if python_only:
+        result = extract_python_sources(local_file, directory, max_member_size)
+    else:
+        with get_archive_manager(str(local_file)) as archive:
+            archive.extractall(path=directory)
+            result = directory / get_first_archive_member(archive)
     if remove_after:
-        os.remove(local_file)
-    return directory / result_dir
+        ars.default_store().discard(source["digests"]["sha256"])
+    return result
 
 
 def get_package(package: str, directory: Path, version: Optional[str] = None):
@@ -0,0 +1,129 @@
+"""Resource limits for the steps of processing a package.
+
+Every step (download, install, analysis) runs with a wall clock timeout and
+limits of memory (RLIMIT_AS) and cpu time (RLIMIT_CPU). The steps running in
+the current process use `limited`, the installs pass the limits to the pip
+workers (see pip_pool).
+
+A step over its time limits raises StepTimeout, and one over its memory limit
+MemoryError; make_dataset stores them with the 'timeout' and 'oom' reasons.
+"""
+
+import contextlib
+import resource
+import signal
+import threading
+from typing import (
+    Iterator,
+    NamedTuple,
+    Optional
+)
+
+
+class Limits(NamedTuple):
+    """Limits of a single step, None means unlimited. """
+    timeout: Optional[float] = None  # Wall clock seconds.
+    memory: Optional[int] = None  # Bytes of address space.
+    cpu: Optional[int] = None  # Seconds of cpu time.
+
+    def scaled(self, factor: float) -> "Limits":
+        """Limits multiplied by a factor, i.e. to retry the steps that failed. """
+        return Limits(*(None if value is None else type(value)(value * factor)
+                        for value in self))
+
+
+class StepTimeout(Exception):
+    """Error raised when a step runs over its wall clock or cpu time limit. """
+    def __init__(self, step: str, seconds: Optional[float]):
+        self.step = step
+        self.seconds = seconds
+        self.msg: str = "Step timed out"
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return f"{self.msg}: {self.step} ({self.seconds} s)"
+
+
+def cpu_time() -> float:
+    """Seconds of cpu time (user and system) used by the current process. """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextlib.contextmanager
+def rlimits(memory: Optional[int] = None, cpu: Optional[int] = None) -> Iterator[None]:
+    """Lower the soft RLIMIT_AS and RLIMIT_CPU of the current process, restoring
+    the previous ones on exit.
+
+    The cpu limit is relative to the cpu time already used. Exceeding it sends
+    SIGXCPU, which terminates the process unless handled.
+    """
+    previous = {}
+    try:
+        if memory is not None:
+            previous[resource.RLIMIT_AS] = resource.getrlimit(resource.RLIMIT_AS)
+            _set_soft_limit(resource.RLIMIT_AS, memory)
+        if cpu is not None:
+            previous[resource.RLIMIT_CPU] = resource.getrlimit(resource.RLIMIT_CPU)
+            _set_soft_limit(resource.RLIMIT_CPU, int(cpu_time()) + 1 + cpu)
+        yield
+    finally:
+        for kind, limit in previous.items():
+            resource.setrlimit(kind, limit)
+
+
+def _set_soft_limit(kind: int, value: int) -> None:
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, hard))
+
+
+@contextlib.contextmanager
+def limited(step: str, limits: Limits) -> Iterator[None]:
+    """Run the body of the context under the limits given.
+
+    The timeouts rely on signals (SIGALRM and SIGXCPU), so they are only applied
+    in the main thread. They interrupt python code and blocking system calls,
+    but not long running calls to C code.
+
+    Parameters
+    ----------
+    step : str
+        Name of the step, for the errors.
+    limits : Limits
+
+    Raises
+    ------
+    StepTimeout
+        When the wall clock or cpu time is exceeded.
+    MemoryError
+        When the memory limit is exceeded.
+
+    Examples
+    --------
+    >>> with limited('analysis', Limits(timeout=60, memory=2 * 1024 ** 3)):
+    ...     report = ss.analyze_archive('click', archive)
+    """
+    if threading.current_thread() is not threading.main_thread():
+        with rlimits(limits.memory):
+            yield
+        return
+
+    def on_alarm(signum, frame):
+        raise StepTimeout(step, limits.timeout)
+
+    def on_cpu(signum, frame):
+        raise StepTimeout(step, limits.cpu)
+
+    previous_alarm = signal.signal(signal.SIGALRM, on_alarm)
+    previous_cpu = signal.signal(signal.SIGXCPU, on_cpu)
+    try:
+        if limits.timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, limits.timeout)
+        with rlimits(limits.memory, limits.cpu):
+            yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_alarm)
+        signal.signal(signal.SIGXCPU, previous_cpu)
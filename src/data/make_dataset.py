@@ -5,7 +5,6 @@ $ reducto_reports --stop=1
 
 TODO:
     - Add logs of the process.
-    - Ensure unnecesary data is cleaned after.
     - Store the total time of the process in the database.
 
 Status:
@@ -18,15 +17,33 @@ Status:
 """
 
 # -*- coding: utf-8 -*-
-from typing import List
+from typing import (
+    Callable,
+    Counter,
+    Deque,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Union
+)
 
+import collections
+import contextlib
+import functools
+import json
 import pathlib
 
 import logging
+import time
 from pathlib import Path
 # from dotenv import find_dotenv, load_dotenv
-from time import time
 from os import cpu_count
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 import tqdm
 import click
@@ -36,6 +53,15 @@ import src.data.download as dwn
 import src.constants as cte
 import src.data.reducto_process as rp
 import src.data.db as db
+import src.data.limits as lim
+import src.data.metrics as mt
+import src.data.pip_pool as pp
+import src.data.pipeline as pl
+import src.data.pypi_client as pc
+import src.data.scheduler as sch
+import src.data.stages as st
+import src.analysis.source_stats as ss
+import src.analysis.stats_cache as sc
 
 LOGFILE = 'reducto3.log'  # filename for the logs
 
@@ -52,6 +78,9 @@ logger.setLevel(logging.INFO)
 
 workers = cpu_count() - 1
 
+# Failures retried at the end of reducto_reports.
+REQUEUE_REASONS = frozenset({"timeout", "oom"})
+
 
 def update_dict_key(dictionary: db.Report, key: str) -> db.Report:
     """Function to update the package name of a report.
@@ -103,9 +132,109 @@ def make_dataset():
     show_default=True,
     help='Stop downloading on this point of the list of packages.'
 )
-def reducto_reports(start: int = 0, stop: int = -1):
+@click.option(
+    '--workers',
+    default=1,
+    show_default=True,
+    help='Number of processes extracting reports at the same time.'
+)
+@click.option(
+    '--in_memory',
+    is_flag=True,
+    help='Analyze the sdists in memory instead of installing them and running reducto.'
+)
+@click.option(
+    '--timeout',
+    default=600,
+    show_default=True,
+    help='Wall clock seconds allowed to each step (download, install, analysis).'
+)
+@click.option(
+    '--memory',
+    default=4096,
+    show_default=True,
+    help='Megabytes of address space allowed to each step.'
+)
+@click.option(
+    '--cpu',
+    default=600,
+    show_default=True,
+    help='Seconds of cpu time allowed to each step.'
+)
+@click.option(
+    '--engine',
+    default='reducto',
+    show_default=True,
+    type=click.Choice(['reducto', 'native']),
+    help='Analyze the installed packages with reducto or with src.analysis.source_stats.'
+)
+@click.option(
+    '--schedule',
+    default='lpt',
+    show_default=True,
+    type=click.Choice(['lpt', 'rank']),
+    help='Process the largest packages first (lpt), or by download rank.'
+)
+@click.option(
+    '--pipeline',
+    is_flag=True,
+    help='Download, install and analyze the packages concurrently, in stages.'
+)
+@click.option(
+    '--fetchers',
+    default=8,
+    show_default=True,
+    help='Threads downloading the packages, with --pipeline.'
+)
+@click.option(
+    '--installers',
+    default=2,
+    show_default=True,
+    help='Threads (and pip workers) installing the packages, with --pipeline.'
+)
+@click.option(
+    '--depth',
+    default=8,
+    show_default=True,
+    help='Packages waiting between two stages at most, with --pipeline.'
+)
+@click.option(
+    '--metrics_port',
+    default=None,
+    type=int,
+    help='Serve the metrics of the run on localhost:PORT/metrics (and /stats).'
+)
+@click.option(
+    '--stats_file',
+    default=None,
+    type=click.Path(path_type=pathlib.Path),
+    help='json file rewritten every 10 seconds with the stats of the run.'
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Process again the packages with a new release since they were analyzed.'
+)
+def reducto_reports(
+        start: int = 0,
+        stop: int = -1,
+        workers: int = 1,
+        in_memory: bool = False,
+        timeout: float = 600,
+        memory: int = 4096,
+        cpu: int = 600,
+        engine: str = 'reducto',
+        schedule: str = 'lpt',
+        pipeline: bool = False,
+        fetchers: int = 8,
+        installers: int = 2,
+        depth: int = 8,
+        metrics_port: Optional[int] = None,
+        stats_file: Optional[pathlib.Path] = None,
+        incremental: bool = False
+):
     """Downloads every package in top-pypi-packages-365-days.json, extracts the reducto
-    report and inserts it to the db.json, and then removes the downloaded package.
+    report and inserts it to the db, and then removes the downloaded package.
 
     Parameters
     ----------
@@ -116,20 +245,221 @@ def reducto_reports(start: int = 0, stop: int = -1):
     stop : int
         Index of the package to stop the process.
         For debugging purposes. Defaults to -1 (downloads until the last).
+    workers : int
+        Number of processes used. With a single worker the packages are processed
+        sequentially in the current process. Otherwise each package is processed
+        in a process pool (every package on its own rp.Workspace), and the
+        results are written to the db from this process only.
+    in_memory : bool
+        Use process_package_in_memory instead of process_package.
+    timeout, memory, cpu
+        Limits of each step (see lim.Limits), in seconds and megabytes.
+        The packages over them are stored with the reason 'timeout' or 'oom',
+        and retried once at the end of the run with twice the limits.
+    engine : str
+        'reducto' or 'native' (ss.analyze_path), the in memory mode is always
+        native.
+    schedule : str
+        'lpt' submits the packages by their predicted cost, the largest first
+        (see sch.schedule), 'rank' in the order of the list of packages.
+    pipeline : bool
+        Run the downloads (fetchers threads), installs (installers threads)
+        and analysis (workers processes) concurrently, see run_pipeline.
+        Ignored with in_memory.
+    fetchers, installers, depth
+        Workers of the download and install stages, and bound of the queues
+        between the stages.
+    metrics_port, stats_file
+        Where the metrics of the run (packages by status, failures by reason,
+        seconds and bytes of each stage) are published while running, see
+        mt.MetricsServer and mt.StatsFile. Not published by default.
+    incremental : bool
+        The packages processed are skipped only while their latest release
+        (version and sha256, see dwn.latest_release) is the one analyzed,
+        otherwise they are processed again. The metadata is obtained through
+        the metadata cache.
     """
     dbs: db.DBStore = db.DBStore()
     # Download the packages.
     packages: List[str] = dwn.get_top_packages()
     subset = packages[start:stop]  # Maybe extract to a small list.
 
-    # Fails to run in parallel, just run it for the moment...
-    for pkg in tqdm.tqdm(subset):
-        print(f'extract reducto: {pkg}')
-        extract_reducto(pkg, dbs)
+    # Filter the packages already processed with a single read of the db.
+    if incremental:
+        processed: Set[str] = unchanged_packages(subset, dbs)
+    else:
+        processed: Set[str] = dbs.get_processed_packages()
+    pending: List[str] = [pkg for pkg in subset if pkg not in processed]
+    print(
+        f'{len(pending)} packages pending, '
+        f'{len(subset) - len(pending)} already processed.'
+    )
+    logger.info(f"Packages pending: {len(pending)} of {len(subset)}.")
+
+    if in_memory:
+        process = process_package_in_memory
+    else:
+        process = functools.partial(process_package, engine=engine)
+    limits = lim.Limits(timeout, memory * 1024 ** 2, cpu)
+    # Strategy of rp.resolve_package which found each package, or its failure reason.
+    outcomes: Dict[str, str] = {}
+    # Packages over the limits, retried at the end (once).
+    requeued: List[str] = []
+    retried: Set[str] = set()
+
+    metrics = mt.Metrics(total=len(pending))
 
-    # partial_reducto = partial(extract_reducto, database=dbs)
-    # with WorkerPool(n_jobs=workers) as pool:
-    #     results = pool.map(partial_reducto, subset, progress_bar=True)
+    def store(result: ReductoResult) -> None:
+        retry = result.reason in REQUEUE_REASONS and result.name not in retried
+        metrics.observe_package(result.status, result.reason, result.stages, retry)
+        outcomes[result.name] = result.strategy if result.status else result.reason
+        if retry:
+            requeued.append(result.name)
+        store_result(result, dbs)
+
+    def run(packages: List[str], limits: lim.Limits) -> None:
+        if schedule == 'lpt':
+            packages = sch.schedule(packages, dbs, workers)
+        start_time = time.perf_counter()
+        try:
+            _run(packages, limits)
+        finally:
+            print(f'Actual makespan: {time.perf_counter() - start_time:.0f} s.')
+
+    def _run(packages: List[str], limits: lim.Limits) -> None:
+        if pipeline and not in_memory:
+            for result in run_pipeline(
+                    packages, limits, engine, fetchers, installers, workers, depth
+            ):
+                store(result)
+            return
+
+        if workers <= 1:
+            for pkg in tqdm.tqdm(packages):
+                print(f'extract reducto: {pkg}')
+                store(process(pkg, limits))
+            return
+
+        # The workers never touch the db, this process is the only writer.
+        results = process_in_pool(packages, process, limits, workers)
+        for result in tqdm.tqdm(results, total=len(packages)):
+            store(result)
+
+    # The inserts are written in groups, and flushed if the run is interrupted.
+    with contextlib.ExitStack() as stack:
+        if metrics_port is not None:
+            stack.enter_context(mt.MetricsServer(metrics, metrics_port))
+        if stats_file is not None:
+            stack.enter_context(mt.StatsFile(metrics, stats_file))
+        stack.enter_context(dbs.buffered())
+        run(pending, limits)
+        if requeued:
+            retry, requeued[:] = list(requeued), []
+            retried.update(retry)
+            print(f'Retrying {len(retry)} packages over the limits.')
+            logger.info(f"Retrying packages over the limits: {retry}.")
+            run(retry, limits.scaled(2))
+
+    counts: Counter[str] = collections.Counter(outcomes.values())
+    print(f'Outcomes: {dict(counts.most_common())}')
+    logger.info(f"Outcomes (strategy or failure reason): {dict(counts)}.")
+
+
+class ReductoResult(NamedTuple):
+    """Outcome of processing a single package.
+
+    Generated by process_package (possibly in a worker process) and written to
+    the db by store_result.
+    """
+    name: str
+    status: bool
+    reason: str
+    report: Optional[db.Report] = None
+    timing: Optional[float] = None
+    strategy: Optional[str] = None  # See rp.resolve_package.
+    stages: Optional[st.Stages] = None
+    release: Optional[dwn.Release] = None  # Release analyzed.
+
+
+def unchanged_packages(packages: List[str], database: db.DBStore) -> Set[str]:
+    """Obtain the packages processed whose latest release is the one analyzed.
+
+    The latest releases are obtained concurrently with pc.get_latest_releases,
+    the packages whose metadata can't be obtained are processed again (as the
+    ones processed before the releases were recorded), so they are never
+    skipped without being checked.
+
+    Parameters
+    ----------
+    packages : List[str]
+        Names of the packages.
+    database : db.DBStore
+        Instance of DBStore.
+
+    Returns
+    -------
+    unchanged : Set[str]
+    """
+    analyzed = database.get_analyzed_releases()
+    releases = pc.get_latest_releases(pkg for pkg in packages if pkg in analyzed)
+    unchecked: List[str] = [pkg for pkg, release in releases.items() if release is None]
+    unchanged: Set[str] = {
+        pkg for pkg, release in releases.items()
+        if release is not None and tuple(release) == analyzed[pkg]
+    }
+    print(
+        f"Incremental run: {len(releases) - len(unchanged) - len(unchecked)} of "
+        f"{len(releases)} packages processed have a new release, "
+        f"{len(unchecked)} couldn't be checked (processed again)."
+    )
+    if unchecked:
+        logger.warning(f"Releases not obtained, processed again: {unchecked}.")
+    return unchanged
+
+
+def already_processed(pkg: str, database: db.DBStore) -> bool:
+    """Check whether a package was already processed correctly.
+
+    Parameters
+    ----------
+    pkg : str
+        Name of the package.
+    database : db.DBStore
+        Instance of DBStore.
+
+    Returns
+    -------
+    processed : bool
+    """
+    check = database.get_reducto_status(pkg)
+    if check is None:
+        return False
+    if not check["status"]:
+        logger.info(f"Errored package, needs review: {pkg}.")
+    return bool(check["status"])
+
+
+def store_result(result: ReductoResult, database: db.DBStore) -> None:
+    """Insert the outcome of process_package to the db.
+
+    Parameters
+    ----------
+    result : ReductoResult
+        Outcome of processing a package.
+    database : db.DBStore
+        Instance of DBStore.
+    """
+    timer = st.StageTimer()
+    with timer.stage('db'):
+        if result.report is not None:
+            database.upsert_report(result.name, result.report)
+        release = result.release or dwn.Release(None, None)
+        database.upsert_status(
+            result.name, result.status, result.reason, result.strategy, *release
+        )
+    if result.timing is not None or result.stages is not None:
+        stages = {**(result.stages or {}), **timer.as_dict()}
+        database.upsert_timing(result.name, result.timing, stages)
 
 
 def extract_reducto(pkg: str = None, database: db.DBStore = None) -> None:
@@ -144,86 +474,426 @@ def extract_reducto(pkg: str = None, database: db.DBStore = None) -> None:
     database : db.DBStore
         Instance of DBStore.
     """
+    if already_processed(pkg, database):
+        logger.info(f"Skipping, package already downloaded: {pkg}.")
+        return
+
+    store_result(process_package(pkg), database)
+
+
+def process_package(
+        pkg: str,
+        limits: lim.Limits = lim.Limits(),
+        engine: str = 'reducto'
+) -> ReductoResult:
+    """Installs a package and runs reducto on it (in process, see rp.analyze).
+
+    Everything is done in a rp.Workspace created for the package and removed
+    afterwards. Doesn't interact with the db, so it can be run in a worker process.
+
+    Parameters
+    ----------
+    pkg : str
+        Name of the package, as obtained from the list of get dwn.get_top_packages.
+    limits : lim.Limits
+        Limits applied to each step (download, install and analysis), the
+        packages over them fail with the reasons 'timeout' or 'oom'.
+    engine : str
+        'reducto' (rp.analyze) or 'native' (ss.analyze_path).
+
+    Returns
+    -------
+    result : ReductoResult
+        With the timings of every stage (see st.STAGES).
+    """
+    timer = st.StageTimer()
+    workspace = rp.Workspace(pkg)
     try:
-        check = database.get_reducto_status(pkg)
-        if check[pkg]:
-            report = database.get_reducto_report(pkg)
-            database.insert_reducto_report(pkg,report)
-            database.insert_reducto_status(pkg, True, "")
-            logger.info(f"Skipping, package already downloaded: {pkg}.")
-            return
-        else:
-            logger.info(f"Errored package, needs review: {pkg}.")
-    except rp.PackageNameNotFound:
-        # Package not downloaded, keep going.
-        pass
+        result = _process_package(pkg, workspace, limits, engine, timer)
+    finally:
+        with timer.stage('cleanup'):
+            workspace.dispose()
+    return result._replace(stages=timer.as_dict())
+
+
+def process_package_in_memory(
+        pkg: str,
+        limits: lim.Limits = lim.Limits()
+) -> ReductoResult:
+    """Obtains the report of a package analyzing its wheel or sdist in memory.
+
+    Nothing is extracted: the pure python wheel (or the sdist when there is
+    none) is obtained through the artifact store and its python files are
+    passed to the in process analysis (see src.analysis.source_stats), which
+    generates a report with the same schema as reducto's.
 
-    # Install directly using pip:
+    Parameters
+    ----------
+    pkg : str
+        Name of the package, as obtained from the list of get dwn.get_top_packages.
+    limits : lim.Limits
+        Limits applied to the download and to the analysis.
+
+    Returns
+    -------
+    result : ReductoResult
+    """
+    timer = st.StageTimer()
+    result = _process_package_in_memory(pkg, limits, timer)
+    return result._replace(stages=timer.as_dict())
+
+
+def _process_package_in_memory(
+        pkg: str,
+        limits: lim.Limits,
+        timer: st.StageTimer
+) -> ReductoResult:
     try:
-        rp.install(pkg)
-        rp.clean_folder(cte.RAW)
-        logger.info(f"{pkg} installed.")
+        with timer.stage('download'), lim.limited('download', limits):
+            metadata = dwn.get_package_metadata(pkg)
+            source = (
+                dwn.select_wheel_file(metadata, pkg)
+                or dwn.select_source_file(metadata, pkg)
+            )
+            version: str = metadata["info"]["version"]
+            archive: pathlib.Path = dwn.fetch_artifact(source, pkg, version)
+        timer.add_bytes('download', st.path_size(archive))
+    except Exception as exc:
+        logger.error(f"{pkg} could not be downloaded due to: {exc}.", exc_info=True)
+        return ReductoResult(pkg, False, failure_reason(exc, "download"))
+
+    try:
+        with timer.stage('analysis'), lim.limited('analysis', limits):
+            report: db.Report = ss.analyze_archive(
+                pkg, archive, sc.default_cache()
+            )
+        timer.add_bytes('analysis', st.path_size(archive))
+        timing = timer.seconds('analysis')
+    except Exception as exc:
+        logger.error(f"analysis failed on: {pkg}, error: {exc}", exc_info=True)
+        return ReductoResult(pkg, False, failure_reason(exc, "reducto_error"))
+
+    logger.info(f"Process finished: {pkg}.")
+    release = dwn.Release(version, source["digests"]["sha256"])
+    return ReductoResult(pkg, True, "", report, timing, release=release)
+
+
+def failure_reason(exc: Exception, default: str) -> str:
+    """Reason stored for a failed step, 'timeout' and 'oom' when the step ran
+    over its limits (see lim.limited and pp.InstallError), the default otherwise.
+    """
+    if isinstance(exc, lim.StepTimeout):
+        return "timeout"
+    if isinstance(exc, MemoryError):
+        return "oom"
+    if isinstance(exc, pp.InstallError) and exc.reason in ("timeout", "oom"):
+        return exc.reason
+    return default
+
+
+def _process_package(
+        pkg: str,
+        workspace: rp.Workspace,
+        limits: lim.Limits,
+        engine: str,
+        timer: st.StageTimer
+) -> ReductoResult:
+    # Install from the wheel, or using pip:
+    try:
+        method, artifact = rp.acquire(pkg, workspace, limits, timer)
+        logger.info(f"{pkg} installed ({method}).")
 
     except Exception as exc:
         logger.error(f"{pkg} could not be installed due to: {exc}.", exc_info=True)
-        # TODO: check if already inserted as False
-        database.insert_reducto_status(pkg, True, "install")
-        return
+        return ReductoResult(pkg, False, failure_reason(exc, "install"))
+
+    result = _analyze_installed(pkg, workspace, limits, engine, timer)
+    if result.status:
+        result = result._replace(release=artifact.release)
+    return result
+
 
+def _analyze_installed(
+        pkg: str,
+        workspace: rp.Workspace,
+        limits: lim.Limits,
+        engine: str,
+        timer: st.StageTimer
+) -> ReductoResult:
     # 3) find the package to be passed to reducto.
     target = None
     try:
-        try:
-            target: pathlib.Path = rp.find_package(pkg)
-        except rp.PackageNameNotFound:
-            logger.info(
-                f"find_packages failed on: {pkg} try with distribution_candidates."
-            )
-            target: pathlib.Path = rp.distribution_candidates()[0]
+        with timer.stage('find_package'):
+            try:
+                target, strategy = rp.resolve_package(pkg, workspace)
+            except rp.PackageNameNotFound:
+                logger.info(
+                    f"find_packages failed on: {pkg} try with distribution_candidates."
+                )
+                target: pathlib.Path = rp.distribution_candidates(workspace)[0]
+                strategy = 'candidates'
     except IndexError:
         logger.error(
             f"{pkg} could not be found, on find_package or distribution_candidates",
             exc_info=True
         )
-        database.insert_reducto_status(pkg, False, "find_package")
+        return ReductoResult(pkg, False, "find_package")
 
-        return
-
-    # 4) Run reducto on it.
+    # 4) Run reducto (or the native engine) on it, in this process.
     if target:
         try:
-            tstart = time()
-            rp.run_reducto(target)
+            with timer.stage('analysis'), lim.limited('analysis', limits):
+                if engine == 'native':
+                    report: db.Report = ss.analyze_path(
+                        target.stem, target, sc.default_cache()
+                    )
+                else:
+                    report: db.Report = rp.analyze(target)
+            timer.add_bytes('analysis', st.path_size(target))
             # Check time running
-            database.insert_reducto_timing(pkg, time() - tstart)
-            rp.clean_folder(cte.DISTRIBUTIONS)
+            timing = timer.seconds('analysis')
             logger.info(f"Reducto run on: {pkg}.")
         except rp.PackageNameNotFound:
-            # TODO: Register to db
             logger.error(f"{pkg} could not be found, running reducto.", exc_info=True)
-            database.insert_reducto_status(pkg, False, "reducto_name")
-            return
+            return ReductoResult(pkg, False, "reducto_name")
         except Exception as exc:
             logger.error(f"reducto failed on: {pkg}, error: {exc}", exc_info=True)
-            database.insert_reducto_status(pkg, False, "reducto_error")
-            return
+            return ReductoResult(pkg, False, failure_reason(exc, "reducto_error"))
     else:
-        database.insert_reducto_status(pkg, False, "find_package")
         logger.error(f"find_package failed on {pkg} .", exc_info=True)
-        return
+        return ReductoResult(pkg, False, "find_package")
 
-    # 5) Read report:
-    report: db.Report = rp.read_reducto_report(target.stem)
-    # 6) Insert to db.
     report = update_dict_key(report, pkg)
-    database.insert_reducto_report(pkg, report)
-    # 7) Clean folders after.
-    rp.clean_folder(cte.REDUCTO_REPORTS)
-
-    # 8) Insert status
-    database.insert_reducto_status(pkg, True, "")
 
     logger.info(f"Process finished: {pkg}.")
+    return ReductoResult(pkg, True, "", report, timing, strategy)
+
+
+def process_in_pool(
+        packages: List[str],
+        process: Callable[[str, lim.Limits], "ReductoResult"],
+        limits: lim.Limits,
+        workers: int
+) -> Iterator["ReductoResult"]:
+    """Process the packages on a pool of processes, yielding the results as
+    they are completed.
+
+    When a worker dies (i.e. killed by the OOM killer, or a segfault in a C
+    extension) the pool is broken, and every package in process fails with it.
+    Those packages are run again one at a time to find the one that killed the
+    worker, which fails with the reason 'oom' when there is a memory limit
+    ('reducto_error' otherwise), and the pool is restarted for the rest.
+
+    Parameters
+    ----------
+    packages : List[str]
+        Names of the packages.
+    process : Callable[[str, lim.Limits], ReductoResult]
+        Function processing a package, see process_package.
+    limits : lim.Limits
+        Limits passed to process.
+    workers : int
+        Number of processes.
+
+    Returns
+    -------
+    results : Iterator[ReductoResult]
+    """
+    pending = collections.deque(packages)
+    reason = "oom" if limits.memory is not None else "reducto_error"
+    while pending:
+        suspects = yield from _process_until_broken(pending, process, limits, workers)
+        for pkg in suspects:
+            try:
+                with pl.process_pool(1) as executor:
+                    yield executor.submit(process, pkg, limits).result()
+            except BrokenProcessPool:
+                logger.error(f"{pkg} killed the worker processing it.")
+                yield ReductoResult(pkg, False, reason)
+            except Exception as exc:
+                logger.error(f"worker failed on: {pkg}, error: {exc}", exc_info=True)
+
+
+def _process_until_broken(
+        pending: Deque[str],
+        process: Callable[[str, lim.Limits], "ReductoResult"],
+        limits: lim.Limits,
+        workers: int
+) -> Generator["ReductoResult", None, List[str]]:
+    """Process the pending packages until they are done or the pool breaks,
+    returning the packages in process when it broke.
+    """
+    running: Dict[Future, str] = {}
+    with pl.process_pool(workers) as executor:
+        # Only as many packages as workers are submitted, so the ones in process
+        # when the pool breaks are known.
+        while pending or running:
+            submitted = _submit_pending(
+                executor, workers, pending, running, process, limits
+            )
+            if not submitted and not running:
+                return []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken: List[str] = []
+            for future in done:
+                pkg = running.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    broken.append(pkg)
+                except Exception as exc:
+                    logger.error(f"worker failed on: {pkg}, error: {exc}", exc_info=True)
+            if broken:
+                suspects = broken + list(running.values())
+                logger.error(f"Process pool broken, processing {suspects} again.")
+                return suspects
+    return []
+
+
+def _submit_pending(
+        executor: ProcessPoolExecutor,
+        workers: int,
+        pending: Deque[str],
+        running: Dict[Future, str],
+        process: Callable[[str, lim.Limits], "ReductoResult"],
+        limits: lim.Limits
+) -> bool:
+    """Submit pending packages until there are as many running as workers,
+    False when the pool is broken.
+    """
+    while pending and len(running) < workers:
+        pkg = pending.popleft()
+        try:
+            running[executor.submit(process, pkg, limits)] = pkg
+        except BrokenProcessPool:
+            pending.appendleft(pkg)
+            return False
+    return True
+
+
+class PipelineJob(NamedTuple):
+    """Package passed between the stages of run_pipeline. """
+    name: str
+    timer: st.StageTimer
+    artifact: Optional[rp.Artifact] = None
+    workspace: Optional[rp.Workspace] = None
+
+
+def run_pipeline(
+        packages: List[str],
+        limits: lim.Limits,
+        engine: str = 'reducto',
+        fetchers: int = 8,
+        installers: int = 2,
+        analyzers: int = 1,
+        depth: int = 8
+) -> Iterator[ReductoResult]:
+    """Process the packages in stages running concurrently (see pl.Pipeline).
+
+    The packages are downloaded on threads (network bound), installed on
+    threads using a pool of pip workers, and analyzed on processes (cpu
+    bound). At most depth packages wait between two stages, so the
+    workspaces installed and waiting for the analysis are bounded.
+
+    The limits are only applied to the pip installs and the analysis, the
+    downloads run on threads where the signals of lim.limited can't be used.
+
+    Parameters
+    ----------
+    packages : List[str]
+        Names of the packages, in the order they are submitted.
+    limits : lim.Limits
+    engine : str
+        See process_package.
+    fetchers, installers, analyzers : int
+        Workers of each stage.
+    depth : int
+        Maximum packages waiting between two stages.
+
+    Yields
+    ------
+    result : ReductoResult
+        In the order they are completed.
+    """
+    with pp.PipPool(size=installers) as pool:
+        pipeline = pl.Pipeline(
+            [
+                pl.Stage('fetch', _pipeline_fetch, fetchers),
+                pl.Stage(
+                    'install',
+                    functools.partial(_pipeline_install, limits=limits, pool=pool),
+                    installers
+                ),
+                pl.Stage(
+                    'analysis',
+                    functools.partial(_pipeline_analyze, limits=limits, engine=engine),
+                    analyzers,
+                    processes=True
+                )
+            ],
+            depth=depth,
+            report=tqdm.tqdm.write
+        )
+        for output in tqdm.tqdm(pipeline.run(packages), total=len(packages)):
+            if isinstance(output, pl.StageError):
+                item = output.item
+                name = item if isinstance(item, str) else item.name
+                if isinstance(item, PipelineJob) and item.workspace is not None:
+                    item.workspace.dispose()
+                default = {'fetch': "download", 'install': "install"}.get(
+                    output.stage, "reducto_error"
+                )
+                output = ReductoResult(name, False, failure_reason(output.error, default))
+            yield output
+
+
+def _pipeline_fetch(pkg: str) -> Union[PipelineJob, pl.Done]:
+    timer = st.StageTimer()
+    try:
+        artifact = rp.fetch_package(pkg, timer)
+    except Exception as exc:
+        logger.error(f"{pkg} could not be downloaded due to: {exc}.", exc_info=True)
+        return pl.Done(ReductoResult(
+            pkg, False, failure_reason(exc, "download"), stages=timer.as_dict()
+        ))
+    return PipelineJob(pkg, timer, artifact)
+
+
+def _pipeline_install(
+        job: PipelineJob,
+        limits: lim.Limits,
+        pool: pp.PipPool
+) -> Union[PipelineJob, pl.Done]:
+    workspace = rp.Workspace(job.name)
+    try:
+        method, artifact = rp.install_artifact(
+            job.name, job.artifact, workspace, limits, job.timer, pool
+        )
+        logger.info(f"{job.name} installed ({method}).")
+    except Exception as exc:
+        logger.error(f"{job.name} could not be installed due to: {exc}.", exc_info=True)
+        with job.timer.stage('cleanup'):
+            workspace.dispose()
+        return pl.Done(ReductoResult(
+            job.name, False, failure_reason(exc, "install"), stages=job.timer.as_dict()
+        ))
+    return job._replace(artifact=artifact, workspace=workspace)
+
+
+def _pipeline_analyze(
+        job: PipelineJob,
+        limits: lim.Limits,
+        engine: str
+) -> ReductoResult:
+    # Runs on a process of the pool, the timer is a copy of the one of the job.
+    try:
+        result = _analyze_installed(job.name, job.workspace, limits, engine, job.timer)
+    finally:
+        with job.timer.stage('cleanup'):
+            job.workspace.dispose()
+    if result.status:
+        result = result._replace(release=job.artifact.release)
+    return result._replace(stages=job.timer.as_dict())
 
 
 @make_dataset.command()
@@ -255,6 +925,198 @@ def reducto_table(output_filename: pathlib.Path = cte.PROCESSED / 'reducto_repor
     table.to_csv(output_filename)
 
 
+@make_dataset.command()
+@click.option(
+    '--top',
+    default=10,
+    show_default=True,
+    help='Number of slowest packages shown per stage.'
+)
+def profile_report(top: int = 10):
+    """Summarizes the time spent on each stage of processing the packages.
+
+    The stages are stored with the timings by reducto_reports (see st.STAGES).
+    """
+    dbs: db.DBStore = db.DBStore()
+    rows = [
+        {
+            "name": timing["name"],
+            "stage": stage,
+            "seconds": measures.get("seconds", 0.),
+            "bytes": measures.get("bytes")
+        }
+        for timing in dbs.reducto_timing_table.all()
+        for stage, measures in (timing.get("stages") or {}).items()
+    ]
+    if not rows:
+        print("No stage timings stored, run reducto_reports first.")
+        return
+
+    table = pd.DataFrame(rows)
+    order = [stage for stage in st.STAGES if stage in set(table["stage"])]
+    grouped = table.groupby("stage")
+    summary = pd.DataFrame({
+        "packages": grouped["seconds"].count(),
+        "total_s": grouped["seconds"].sum(),
+        "p50_s": grouped["seconds"].median(),
+        "p95_s": grouped["seconds"].quantile(0.95),
+        "max_s": grouped["seconds"].max(),
+        "MB": grouped["bytes"].sum() / 1024 ** 2,
+    }).reindex(order)
+    summary["share"] = summary["total_s"] / summary["total_s"].sum()
+    print(summary.round(3).to_string())
+
+    for stage in order:
+        slowest = table[table["stage"] == stage].nlargest(top, "seconds")
+        print(f"\nSlowest packages on {stage}:")
+        print(slowest[["name", "seconds", "bytes"]].to_string(index=False))
+
+
+@make_dataset.command()
+@click.argument('target', type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option(
+    '--name',
+    default=None,
+    help='Key of the report. Defaults to the name of the target.'
+)
+@click.option(
+    '--output',
+    default=None,
+    type=click.Path(path_type=pathlib.Path),
+    help='json file to write the report, printed otherwise.'
+)
+def source_stats(
+        target: pathlib.Path,
+        name: Optional[str] = None,
+        output: Optional[pathlib.Path] = None
+):
+    """Obtains the report of a package (directory) or module, like reducto does.
+
+    The report has the same format as the output of reducto, so it can be read
+    with rp.read_reducto_report.
+    """
+    report: db.Report = ss.analyze_path(name or target.stem, target)
+    if output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+@make_dataset.command()
+@click.option(
+    '--reducto_table',
+    default=cte.REDUCTO_TABLE_ROOT,
+    show_default=True,
+    type=click.Path(exists=True, path_type=pathlib.Path),
+    help='Table of reducto reports (see reducto_table) to compare against.'
+)
+@click.option(
+    '--limit',
+    default=100,
+    show_default=True,
+    help='Number of packages compared, from the start of the table.'
+)
+@click.option(
+    '--output',
+    default=None,
+    type=click.Path(path_type=pathlib.Path),
+    help='csv file to write the native reports.'
+)
+def cross_check(
+        reducto_table: pathlib.Path = cte.REDUCTO_TABLE_ROOT,
+        limit: int = 100,
+        output: Optional[pathlib.Path] = None
+):
+    """Compares the reports of the native engine against the ones of reducto.
+
+    Every package is installed and the same target reducto analyzed is found
+    (process_package with the native engine), so both sides report the same
+    files. Each column is compared with the reducto table: the share of
+    packages with the exact same value, and the median relative difference.
+
+    The packages whose release recorded in the db differs from the one
+    installed are skipped, the ones processed before the releases were
+    recorded are compared anyway.
+    """
+    expected = pd.read_csv(reducto_table, index_col=0).head(limit)
+    analyzed = db.DBStore().get_analyzed_releases()
+    reports: Dict[str, Dict[str, int]] = {}
+    for pkg in tqdm.tqdm(expected.index):
+        result = process_package(pkg, engine='native')
+        if not result.status:
+            logger.info(f"cross_check skipping {pkg}: {result.reason}.")
+            continue
+        version = analyzed.get(pkg, (None, None))[0]
+        installed = result.release.version if result.release else None
+        if version is not None and version != installed:
+            logger.info(
+                f"cross_check skipping {pkg}: reducto analyzed {version}, "
+                f"the native engine {installed}."
+            )
+            continue
+        reports.update(result.report)
+
+    native = pd.DataFrame.from_dict(reports, orient='index', columns=expected.columns)
+    if output is not None:
+        native.to_csv(output)
+    if native.empty:
+        print("No package could be analyzed.")
+        return
+
+    print(f"{len(native)} of {len(expected)} packages compared.")
+    expected = expected.loc[native.index]
+    relative = (native - expected).abs() / expected.where(expected != 0, 1)
+    summary = pd.DataFrame({
+        "exact": (native == expected).mean(),
+        "median_rel_diff": relative.median(),
+    })
+    print(summary.round(3).to_string())
+
+    worst = relative.mean(axis=1).nlargest(10)
+    print("\nPackages with the largest differences (mean relative difference):")
+    print(worst.round(3).to_string())
+
+
+@make_dataset.command()
+@click.option(
+    '--json_path',
+    default=cte.DB_JSON_PATH,
+    show_default=True,
+    type=click.Path(exists=True, path_type=pathlib.Path),
+    help='TinyDB file to migrate.'
+)
+@click.option(
+    '--dbpath',
+    default=cte.DB_PATH,
+    show_default=True,
+    type=click.Path(path_type=pathlib.Path),
+    help='SQLite database where the tables are copied.'
+)
+def migrate_db(
+        json_path: pathlib.Path = cte.DB_JSON_PATH,
+        dbpath: pathlib.Path = cte.DB_PATH
+):
+    """Copies the tables of the previous TinyDB db.json to the SQLite database. """
+    migrated = db.migrate_tinydb(json_path, db.SQLiteStorage(dbpath))
+    for table, documents in migrated.items():
+        print(f"{table}: {documents} documents migrated.")
+
+
+@make_dataset.command()
+@click.option(
+    '--json_path',
+    default=cte.DB_JSON_PATH,
+    show_default=True,
+    type=click.Path(exists=True, path_type=pathlib.Path),
+    help='TinyDB file to compact.'
+)
+def compact_db(json_path: pathlib.Path = cte.DB_JSON_PATH):
+    """Removes the repeated documents of each package in a TinyDB db.json. """
+    for table, (before, after) in db.compact_tinydb(json_path).items():
+        print(f"{table}: {before} -> {after} documents.")
+
+
 @click.command()
 @click.argument('input_filepath', type=click.Path(exists=True))
 @click.argument('output_filepath', type=click.Path())
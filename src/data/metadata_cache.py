@@ -0,0 +1,180 @@
+"""On-disk cache of the PyPI JSON metadata.
+
+Only the fields used in this project are kept (the files of each release, with
+their url, python_version and digests), along with the ETag of the response.
+The entries are served without a request while younger than the TTL, and are
+revalidated with If-None-Match afterwards. The least recently used entries are
+evicted when the cache grows over its size budget.
+"""
+
+import json
+import pathlib
+import time
+from typing import (
+    Any,
+    Dict,
+    NamedTuple,
+    Optional
+)
+
+import src.constants as cte
+import src.data.sqlite_lru as lru
+
+
+Metadata = Dict[str, Any]
+
+# Fields kept of every file of a release.
+FILE_FIELDS = ('filename', 'url', 'packagetype', 'python_version', 'size')
+
+
+class CacheEntry(NamedTuple):
+    """Metadata of a package as stored in the cache. """
+    metadata: Metadata
+    etag: Optional[str]
+    fetched: float
+
+
+def trim_file(file: Metadata) -> Metadata:
+    """Keep the fields of a release file used in this project. """
+    trimmed = {field: file.get(field) for field in FILE_FIELDS}
+    trimmed['digests'] = {'sha256': file.get('digests', {}).get('sha256')}
+    return trimmed
+
+
+def trim_metadata(metadata: Metadata) -> Metadata:
+    """Reduce the PyPI JSON metadata of a package to the fields used in this project.
+
+    The result keeps the structure of the original (info, urls and releases),
+    so it can be passed to dwn.select_source.
+
+    Parameters
+    ----------
+    metadata : Metadata
+        Content of https://pypi.org/pypi/<package>/json.
+
+    Returns
+    -------
+    trimmed : Metadata
+
+    Examples
+    --------
+    >>> trim_metadata(metadata)
+    {'info': {'name': 'click', 'version': '8.0.3'}, 'urls': [{'digests': {...
+    """
+    info = metadata.get('info', {})
+    return {
+        'info': {'name': info.get('name'), 'version': info.get('version')},
+        'urls': [trim_file(file) for file in metadata.get('urls', [])],
+        'releases': {
+            version: [trim_file(file) for file in files]
+            for version, files in metadata.get('releases', {}).items()
+        }
+    }
+
+
+class MetadataCache(lru.SQLiteLRU):
+    """Cache of trimmed PyPI metadata by package name, stored in SQLite.
+
+    Examples
+    --------
+    >>> cache = MetadataCache()
+    >>> entry = cache.get('click')
+    >>> if entry is None or not cache.is_fresh(entry):
+    ...     cache.put('click', trim_metadata(metadata), etag)
+    """
+    TABLE = 'metadata'
+    KEY = 'name'
+    COLUMNS = (
+        'metadata TEXT NOT NULL, etag TEXT, fetched REAL NOT NULL, size INTEGER NOT NULL'
+    )
+
+    def __init__(
+            self,
+            path: pathlib.Path = cte.METADATA_CACHE,
+            ttl: float = 24 * 60 * 60,
+            max_bytes: int = 512 * 1024 ** 2
+    ):
+        """
+        Parameters
+        ----------
+        path : pathlib.Path
+            Path of the sqlite file. Defaults to cte.METADATA_CACHE.
+        ttl : float
+            Seconds an entry is used without revalidating it. Defaults to a day.
+        max_bytes : int
+            Size budget of the metadata stored, the least recently used entries
+            are removed when exceeded. Defaults to 512 MB.
+        """
+        self._path = pathlib.Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        super().__init__(self._path)
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self._path})"
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Whether the entry can be used without revalidating it. """
+        return time.time() - entry.fetched < self.ttl
+
+    def get(self, name: str) -> Optional[CacheEntry]:
+        """Obtain the entry of a package, marking it as recently used.
+
+        Parameters
+        ----------
+        name : str
+            Name of the package.
+
+        Returns
+        -------
+        entry : CacheEntry or None
+            None if the package is not cached.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT metadata, etag, fetched FROM metadata WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return
+            self._touch([name], time.time())
+        metadata, etag, fetched = row
+        return CacheEntry(json.loads(metadata), etag, fetched)
+
+    def put(self, name: str, metadata: Metadata, etag: Optional[str] = None) -> None:
+        """Store the (trimmed) metadata of a package.
+
+        Parameters
+        ----------
+        name : str
+            Name of the package.
+        metadata : Metadata
+            Metadata, as returned by trim_metadata.
+        etag : str, optional
+            ETag of the response, used to revalidate the entry.
+        """
+        content = json.dumps(metadata, separators=(',', ':'))
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata "
+                "(name, metadata, etag, fetched, accessed, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, content, etag, now, now, len(content))
+            )
+            self._evict(self.max_bytes, keep=name)
+
+    def revalidated(self, name: str) -> None:
+        """Mark an entry as fresh again, after a 304 response. """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE metadata SET fetched = ?, accessed = ? WHERE name = ?",
+                (now, now, name)
+            )
+
+_default_cache = lru.per_process(MetadataCache)
+
+
+def default_cache() -> MetadataCache:
+    """Cache at cte.METADATA_CACHE shared inside the current process. """
+    return _default_cache()
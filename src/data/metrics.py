@@ -0,0 +1,337 @@
+"""Live metrics of a reducto_reports run.
+
+The outcome of every package (see make_dataset.reducto_reports) is added to a
+Metrics instance: packages processed by status (each one counted once, the
+packages retried with their last outcome), failures by reason, the
+seconds of the packages by outcome (ok or the failure reason), and the seconds
+and bytes of each stage (see st.StageTimer), as counters and histograms.
+
+They can be followed from another terminal, through an http endpoint on
+localhost in the Prometheus text format:
+
+    $ curl localhost:9100/metrics
+    reducto_packages_total{status="ok"} 1201
+    reducto_failures_total{reason="install"} 37
+    reducto_package_seconds_bucket{outcome="install",le="60"} 30
+    reducto_stage_seconds_bucket{stage="download",le="1"} 950
+    ...
+
+or through a json file rewritten periodically, with the throughput and ETA:
+
+    $ cat data/processed/reducto_stats.json
+    {"elapsed": 3600.5, "packages": 1238, "pending": 2761, "rate": 0.34,
+     "eta": 8120.2, "failure_rate": 0.03, ...}
+
+Both only use the standard library.
+"""
+
+import http.server
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple
+)
+
+
+# Upper bounds of the buckets of the histograms of seconds.
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, float('inf'))
+# Failure reasons always reported, even before any package fails.
+FAILURE_REASONS = (
+    'download', 'install', 'find_package', 'reducto_error', 'reducto_name',
+    'timeout', 'oom'
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative histogram, like the ones of Prometheus. """
+    def __init__(self, buckets: Iterable[float] = SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket containing the quantile q. """
+        if not self.count:
+            return
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= q * self.count:
+                return bound
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else f'{bound:g}'
+
+
+class Metrics:
+    """Counters and histograms of a run, safe to share between threads.
+
+    Examples
+    --------
+    >>> metrics = Metrics(total=4000)
+    >>> metrics.observe_package(True, '', {'download': {'seconds': 0.2, 'bytes': 97345}})
+    >>> print(metrics.render_prometheus())
+    """
+    def __init__(self, total: Optional[int] = None, prefix: str = 'reducto'):
+        """
+        Parameters
+        ----------
+        total : int, optional
+            Packages expected in the run, for the ETA.
+        prefix : str
+            Prefix of the names of the metrics. Defaults to 'reducto'.
+        """
+        self.total = total
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        for reason in FAILURE_REASONS:
+            self.inc('failures_total', reason=reason, value=0)
+
+    def __repr__(self):
+        return type(self).__name__ + f"(total={self.total})"
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add a value to a counter. """
+        key: Labels = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Add a value to a histogram. """
+        key: Labels = tuple(sorted(labels.items()))
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            histograms.setdefault(key, Histogram()).observe(value)
+
+    def observe_package(
+            self,
+            status: bool,
+            reason: str,
+            stages: Optional[Dict[str, Dict[str, float]]] = None,
+            retry: bool = False
+    ) -> None:
+        """Add the outcome of a package.
+
+        Parameters
+        ----------
+        status : bool
+            Whether the package was processed correctly.
+        reason : str
+            Reason of the failure, see db.DBStore.upsert_status.
+        stages : Dict[str, Dict[str, float]], optional
+            Seconds and bytes of each stage, see st.StageTimer.
+        retry : bool
+            Whether the package will be processed again, then only its stages
+            are added and the package is counted (once) with its last outcome.
+            Defaults to False.
+        """
+        stages = stages or {}
+        if retry:
+            self.inc('packages_retried_total')
+        else:
+            self.inc('packages_total', status='ok' if status else 'failed')
+            if not status:
+                self.inc('failures_total', reason=reason)
+            self.observe(
+                'package_seconds',
+                sum(measures.get('seconds', 0.) for measures in stages.values()),
+                outcome='ok' if status else reason
+            )
+        for stage, measures in stages.items():
+            self.observe('stage_seconds', measures.get('seconds', 0.), stage=stage)
+            if 'bytes' in measures:
+                self.inc('stage_bytes_total', measures['bytes'], stage=stage)
+
+    def render_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format. """
+        lines: List[str] = []
+        with self._lock:
+            for name, values in sorted(self._counters.items()):
+                full_name = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {full_name} counter')
+                for labels, value in sorted(values.items()):
+                    lines.append(f'{full_name}{_format_labels(labels)} {value:g}')
+            for name, histograms in sorted(self._histograms.items()):
+                full_name = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {full_name} histogram')
+                for labels, histogram in sorted(histograms.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        le = f'le="{_format_bound(bound)}"'
+                        lines.append(
+                            f'{full_name}_bucket{_format_labels(labels, le)} {count}'
+                        )
+                    lines.append(
+                        f'{full_name}_sum{_format_labels(labels)} {histogram.sum:g}'
+                    )
+                    lines.append(
+                        f'{full_name}_count{_format_labels(labels)} {histogram.count}'
+                    )
+        elapsed = time.time() - self.started
+        lines.append(f'# TYPE {self.prefix}_elapsed_seconds gauge')
+        lines.append(f'{self.prefix}_elapsed_seconds {elapsed:.1f}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the run: throughput, ETA, failures by reason and the
+        seconds (count, sum, p50 and p95 bucket) and bytes of each stage.
+        """
+        with self._lock:
+            packages = self._counters.get('packages_total', {})
+            done = sum(packages.values())
+            failed = packages.get((('status', 'failed'),), 0)
+            failures = {
+                dict(labels)['reason']: value
+                for labels, value in self._counters.get('failures_total', {}).items()
+            }
+            stage_bytes = {
+                dict(labels)['stage']: value
+                for labels, value in self._counters.get('stage_bytes_total', {}).items()
+            }
+            stages = {
+                dict(labels)['stage']: {
+                    'count': histogram.count,
+                    'seconds': round(histogram.sum, 3),
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'bytes': stage_bytes.get(dict(labels)['stage'], 0)
+                }
+                for labels, histogram in self._histograms.get('stage_seconds', {}).items()
+            }
+
+        elapsed = time.time() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.
+        pending = None if self.total is None else max(self.total - done, 0)
+        return {
+            'elapsed': round(elapsed, 1),
+            'packages': done,
+            'pending': pending,
+            'rate': round(rate, 4),
+            'eta': None if pending is None or not rate else round(pending / rate, 1),
+            'failure_rate': round(failed / done, 4) if done else 0.,
+            'failures': failures,
+            'stages': stages,
+            'updated': time.time()
+        }
+
+
+class MetricsServer:
+    """Serves the metrics on localhost (/metrics, Prometheus text, and
+    /stats, the json snapshot) from a daemon thread.
+
+    Examples
+    --------
+    >>> with MetricsServer(metrics, port=9100):
+    ...     run()
+    """
+    def __init__(self, metrics: Metrics, port: int = 9100, host: str = '127.0.0.1'):
+        metrics_ = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics'):
+                    body = metrics_.render_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path.startswith('/stats'):
+                    body = json.dumps(metrics_.snapshot()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Keep the requests out of the output of the run.
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __repr__(self):
+        host, port = self._server.server_address[:2]
+        return type(self).__name__ + f"({host}:{port})"
+
+    def __enter__(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StatsFile:
+    """Rewrites the json snapshot of the metrics to a file periodically (and
+    once more when closed), replacing it atomically so readers never see a
+    partial file.
+
+    Examples
+    --------
+    >>> with StatsFile(metrics, cte.PROCESSED / 'reducto_stats.json', every=10):
+    ...     run()
+    """
+    def __init__(self, metrics: Metrics, path: pathlib.Path, every: float = 10.):
+        self.metrics = metrics
+        self.path = pathlib.Path(path)
+        self.every = every
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.path})"
+
+    def __enter__(self) -> "StatsFile":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self) -> None:
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(self.metrics.snapshot(), f, indent=4)
+        os.replace(temporary, self.path)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.every):
+            self.write()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.write()
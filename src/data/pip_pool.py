@@ -0,0 +1,346 @@
+"""Pool of long-lived pip processes.
+
+Running `python -m pip install` for every package pays the interpreter startup
+and pip's imports (around a second) before doing any work. The workers in this
+module import pip once, and then run the install commands they receive over
+their stdin, answering on their stdout with a json line per job:
+
+    -> {"args": ["install", "--no-deps", "-t", "/dev/shm/...", "black"],
+        "memory": 4294967296, "cpu": 600}
+    <- {"returncode": 0, "output": "Collecting black...", "reason": "error"}
+
+The memory (RLIMIT_AS) and cpu time (RLIMIT_CPU) limits of a job apply to the
+worker and the build processes started by pip, and the client kills the
+worker (and its process group) when a job runs over its timeout.
+
+This file is executed as a script by the workers, so it must only depend on the
+standard library (and pip).
+"""
+
+import atexit
+import contextlib
+import io
+import json
+import os
+import pathlib
+import queue
+import resource
+import select
+import signal
+import subprocess
+import sys
+import time
+import traceback
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Sequence
+)
+
+
+Message = Dict[str, Any]
+
+WORKER_SCRIPT: pathlib.Path = pathlib.Path(__file__).resolve()
+
+
+class InstallError(Exception):
+    """Error raised when pip fails to install a package.
+
+    The reason is 'timeout' or 'oom' when the install ran over its limits,
+    'error' otherwise.
+    """
+    def __init__(self, package: str, returncode: int, output: str, reason: str = 'error'):
+        self.package = package
+        self.returncode = returncode
+        self.output = output
+        self.reason = reason
+        self.msg: str = "pip install failed"
+        super().__init__(self.msg)
+
+    def __str__(self):
+        lines = self.output.strip().splitlines()
+        last = lines[-1] if lines else ''
+        return (
+            f"{self.msg}: {self.package} "
+            f"(returncode {self.returncode}, {self.reason}) {last}"
+        )
+
+
+def _send(stream: io.TextIOBase, message: Message) -> None:
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+class _CpuTimeExceeded(Exception):
+    pass
+
+
+def _on_cpu_exceeded(signum, frame):
+    raise _CpuTimeExceeded()
+
+
+def _set_limits(memory: Optional[int], cpu: Optional[int]) -> None:
+    """Set the soft limits of a job, the cpu limit relative to the time used.
+    None removes the limit (up to the hard one).
+    """
+    for kind, value in ((resource.RLIMIT_AS, memory), (resource.RLIMIT_CPU, cpu)):
+        _, hard = resource.getrlimit(kind)
+        if value is not None and kind == resource.RLIMIT_CPU:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            value += int(usage.ru_utime + usage.ru_stime) + 1
+        if value is None:
+            value = hard
+        elif hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(kind, (value, hard))
+
+
+def serve() -> None:
+    """Main loop of a worker, runs pip for every job read from stdin until EOF. """
+    # Keep the real stdout for the replies, anything else written to the file
+    # descriptor (i.e. the subprocesses of pip) goes to stderr.
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    from pip._internal.cli.main import main as pip_main
+    from pip._internal.commands import create_command
+    create_command('install')  # Imports most of pip.
+    _send(replies, {'ready': True})
+
+    signal.signal(signal.SIGXCPU, _on_cpu_exceeded)
+    for line in sys.stdin:
+        job: Message = json.loads(line)
+        output = io.StringIO()
+        reason = 'error'
+        try:
+            _set_limits(job.get('memory'), job.get('cpu'))
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                returncode = pip_main(job['args'])
+        except SystemExit as exc:
+            returncode = exc.code if isinstance(exc.code, int) else 1
+        except Exception:
+            returncode = 1
+            output.write(traceback.format_exc())
+        finally:
+            _set_limits(None, None)
+        # pip catches every exception, look for them in its output.
+        if '_CpuTimeExceeded' in output.getvalue():
+            reason = 'timeout'
+        elif 'MemoryError' in output.getvalue():
+            reason = 'oom'
+        _send(replies, {
+            'returncode': returncode, 'output': output.getvalue(), 'reason': reason
+        })
+
+
+class PipWorker:
+    """Client side of a worker process. """
+    def __init__(self):
+        self._process = subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            # Own process group, to kill the build processes along with the worker.
+            start_new_session=True
+        )
+        self._ready = False
+        self.jobs = 0
+
+    def __repr__(self):
+        return type(self).__name__ + f"(pid={self._process.pid}, jobs={self.jobs})"
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def _receive(self, timeout: Optional[float] = None) -> Optional[Message]:
+        if timeout is not None:
+            readable, _, _ = select.select([self._process.stdout], [], [], timeout)
+            if not readable:
+                raise TimeoutError()
+        line = self._process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def run(
+            self,
+            args: Sequence[str],
+            timeout: Optional[float] = None,
+            memory: Optional[int] = None,
+            cpu: Optional[int] = None
+    ) -> Optional[Message]:
+        """Run a pip command on the worker.
+
+        Parameters
+        ----------
+        args : Sequence[str]
+            Arguments of pip (without `python -m pip`).
+        timeout : float, optional
+            Seconds to wait for the reply, the worker is killed afterwards.
+        memory : int, optional
+            Bytes of address space allowed (RLIMIT_AS).
+        cpu : int, optional
+            Seconds of cpu time allowed (RLIMIT_CPU).
+
+        Returns
+        -------
+        reply : Message or None
+            returncode, output and reason of the failure, None if the worker
+            died.
+
+        Raises
+        ------
+        TimeoutError
+            When the reply didn't arrive in time, the worker is killed.
+        """
+        try:
+            if not self._ready:
+                self._ready = self._receive() is not None
+            started = time.monotonic()
+            _send(self._process.stdin, {'args': list(args), 'memory': memory, 'cpu': cpu})
+            self.jobs += 1
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            return self._receive(remaining)
+        except TimeoutError:
+            self.kill()
+            raise
+        except (OSError, ValueError):
+            # Broken pipe or a closed stream, the process is gone.
+            return
+
+    def kill(self) -> None:
+        """Kill the worker and the processes it started. """
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+
+    def close(self) -> None:
+        if self._process.stdin and not self._process.stdin.closed:
+            self._process.stdin.close()
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process.stdout.close()
+
+
+class PipPool:
+    """Pool of pre-warmed pip workers.
+
+    The workers are started (and import pip) when the pool is created, and are
+    replaced after max_jobs installs to avoid accumulating the state pip keeps
+    between runs. Safe to share between threads.
+
+    Examples
+    --------
+    >>> with PipPool(size=2) as pool:
+    ...     pool.install('black', ['--no-deps', '-t', '/dev/shm/black/distributions'])
+    """
+    def __init__(self, size: int = 1, max_jobs: int = 100):
+        """
+        Parameters
+        ----------
+        size : int
+            Number of worker processes. Defaults to 1.
+        max_jobs : int
+            Installs run by a worker before it's replaced. Defaults to 100.
+        """
+        self.size = size
+        self.max_jobs = max_jobs
+        self._idle: "queue.Queue[PipWorker]" = queue.Queue()
+        for _ in range(size):
+            self._idle.put(PipWorker())
+
+    def __repr__(self):
+        return type(self).__name__ + f"(size={self.size})"
+
+    def __enter__(self) -> "PipPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def install(
+            self,
+            package: str,
+            options: Sequence[str] = (),
+            timeout: Optional[float] = None,
+            memory: Optional[int] = None,
+            cpu: Optional[int] = None
+    ) -> str:
+        """Install a package on one of the workers.
+
+        Parameters
+        ----------
+        package : str
+            Name, path or requirement passed to pip install.
+        options : Sequence[str]
+            Options of pip install (--no-deps, -t...).
+        timeout, memory, cpu
+            Limits of the install, see PipWorker.run.
+
+        Returns
+        -------
+        output : str
+            What pip printed.
+
+        Raises
+        ------
+        InstallError
+            When pip returns an error code, or the worker died or ran out of
+            time while installing.
+        """
+        args = ['install', '--disable-pip-version-check', *options, str(package)]
+        worker = self._idle.get()
+        try:
+            reply = worker.run(args, timeout, memory, cpu)
+        except TimeoutError:
+            raise InstallError(str(package), -1, "pip worker killed", 'timeout') from None
+        except BaseException:
+            # Interrupted waiting for the reply, the worker is out of sync and
+            # may be running a build backend: kill its whole process group.
+            worker.kill()
+            worker.close()
+            worker = PipWorker()
+            raise
+        finally:
+            if not worker.alive or worker.jobs >= self.max_jobs:
+                worker.close()
+                worker = PipWorker()
+            self._idle.put(worker)
+
+        if reply is None:
+            raise InstallError(str(package), -1, "pip worker died")
+        if reply['returncode'] != 0:
+            raise InstallError(
+                str(package), reply['returncode'], reply['output'], reply['reason']
+            )
+        return reply['output']
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+_default_pool: Dict[int, PipPool] = {}
+
+
+def default_pool() -> PipPool:
+    """Pool with a single worker shared inside the current process.
+
+    Every process of make_dataset installs one package at a time, so one worker
+    per process is enough.
+    """
+    pid = os.getpid()
+    if pid not in _default_pool:
+        _default_pool[pid] = PipPool()
+        atexit.register(_default_pool[pid].close)
+    return _default_pool[pid]
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,341 @@
+"""Pipeline of stages connected by bounded queues.
+
+Processing a package alternates network (download), disk and cpu (install) and
+cpu (analysis), so running the steps of every package one after the other
+leaves the network idle while analyzing and the cpus idle while downloading.
+The Pipeline runs each step as a stage with its own workers (threads, or
+processes for the cpu bound ones), passing the items through bounded queues:
+
+    packages -> [fetch: 8 threads] -> queue -> [install: 2 threads] -> queue
+             -> [analysis: n processes] -> results
+
+A full queue blocks the stage before it (back-pressure), so the number of
+items downloaded or installed and waiting (and the disk they use) is bounded.
+The depth of the queues and the utilization of every stage (busy workers over
+the workers of the stage) are reported periodically while running.
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence
+)
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Marks the end of the items of a queue.
+_END = object()
+
+
+class Stage(NamedTuple):
+    """Step of the pipeline.
+
+    The function receives the output of the previous stage (or an item of the
+    input), and its return value is passed to the next one. Returning a Done
+    sends the value directly to the output, skipping the remaining stages.
+    The functions of the stages run on processes must be picklable, as the
+    items they receive and return.
+    """
+    name: str
+    function: Callable[[Any], Any]
+    workers: int = 1
+    processes: bool = False
+
+
+class Done(NamedTuple):
+    """Output of a stage that ends the processing of an item, i.e. on failure. """
+    value: Any
+
+
+class StageError(NamedTuple):
+    """Output of a stage function that raised, the item is not processed further. """
+    stage: str
+    item: Any
+    error: BaseException
+
+
+class _StageState:
+    """Busy workers of a stage, sampled for the utilization. """
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.active = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+        self.samples: List[int] = []
+
+    def start(self) -> None:
+        with self.lock:
+            self.active += 1
+
+    def finish(self) -> None:
+        with self.lock:
+            self.active -= 1
+            self.processed += 1
+
+    def sample(self) -> None:
+        with self.lock:
+            self.samples.append(self.active)
+
+    def utilization(self) -> float:
+        """Mean busy workers since the last call, over the workers of the stage. """
+        with self.lock:
+            samples, self.samples = self.samples, []
+        if not samples:
+            return 0.
+        return sum(samples) / len(samples) / self.stage.workers
+
+
+class Pipeline:
+    """Runs the items through the stages, each one with its own workers.
+
+    Examples
+    --------
+    >>> pipeline = Pipeline([
+    ...     Stage('fetch', fetch, workers=8),
+    ...     Stage('install', install, workers=2),
+    ...     Stage('analysis', analyze, workers=4, processes=True)
+    ... ], depth=8)
+    >>> for result in pipeline.run(packages):
+    ...     store_result(result, dbs)
+    """
+    def __init__(
+            self,
+            stages: Sequence[Stage],
+            depth: int = 8,
+            report_every: Optional[float] = 10.,
+            report: Callable[[str], None] = print
+    ):
+        """
+        Parameters
+        ----------
+        stages : Sequence[Stage]
+            Stages in the order they are applied.
+        depth : int
+            Maximum items waiting between two stages. Defaults to 8.
+        report_every : float, optional
+            Seconds between the reports of the queue depths and utilization,
+            None to disable them. Defaults to 10.
+        report : Callable[[str], None]
+            Function called with every report. Defaults to print.
+        """
+        self.stages = list(stages)
+        self.depth = depth
+        self.report_every = report_every
+        self.report = report
+        self._states = [_StageState(stage) for stage in self.stages]
+        # Input of each stage.
+        self._queues: List["queue.Queue[Any]"] = [
+            queue.Queue(maxsize=depth) for _ in self.stages
+        ]
+        self._output: "queue.Queue[Any]" = queue.Queue()
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return type(self).__name__ + f"({[stage.name for stage in self.stages]})"
+
+    def status(self) -> Dict[str, Dict[str, float]]:
+        """Queue depth (items waiting for the stage), busy workers, items
+        processed and utilization since the last call of each stage.
+        """
+        return {
+            state.stage.name: {
+                'queued': self._queues[index].qsize(),
+                'active': state.active,
+                'processed': state.processed,
+                'utilization': state.utilization()
+            }
+            for index, state in enumerate(self._states)
+        }
+
+    def format_status(self) -> str:
+        return " | ".join(
+            f"{name}: {values['queued']}/{self.depth} queued, "
+            f"{values['active']} busy, {values['utilization']:.0%} used, "
+            f"{values['processed']} done"
+            for name, values in self.status().items()
+        )
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """Process the items, yielding the outputs as they are completed.
+
+        The outputs are the values returned by the last stage, the values of
+        the Done returned by any stage, and a StageError for every item whose
+        stage function raised.
+        """
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            if stage.processes:
+                threads.append(threading.Thread(
+                    target=self._dispatch, args=(index,), daemon=True
+                ))
+            else:
+                finished = _Countdown(
+                    stage.workers, lambda index=index: self._finish_threads(index)
+                )
+                threads.extend(
+                    threading.Thread(
+                        target=self._work, args=(index, finished), daemon=True
+                    )
+                    for _ in range(stage.workers)
+                )
+        threads.append(threading.Thread(target=self._monitor, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                output = self._output.get()
+                if output is _END:
+                    break
+                yield output
+        finally:
+            self._stop.set()
+        if self.report_every is not None:
+            self.report(self.format_status())
+
+    def _put(self, index: int, item: Any) -> None:
+        """Pass an item to the stage at index, or to the output after the last. """
+        if isinstance(item, (Done, StageError)):
+            self._output.put(item.value if isinstance(item, Done) else item)
+        elif index == len(self.stages):
+            self._output.put(item)
+        else:
+            self._queues[index].put(item)
+
+    def _end(self, index: int) -> None:
+        """Mark the end of the items after the stage at index. """
+        if index + 1 == len(self.stages):
+            self._output.put(_END)
+        else:
+            self._queues[index + 1].put(_END)
+
+    def _finish_threads(self, index: int) -> None:
+        """Called when the threads of the stage at index are done. """
+        # Remove the end marker left by the last thread.
+        self._queues[index].get_nowait()
+        self._end(index)
+
+    def _feed(self, items: Iterable[Any]) -> None:
+        for item in items:
+            if self._stop.is_set():
+                break
+            self._queues[0].put(item)
+        self._queues[0].put(_END)
+
+    def _apply(self, index: int, item: Any) -> Any:
+        state = self._states[index]
+        state.start()
+        try:
+            return state.stage.function(item)
+        except Exception as exc:
+            logger.error(f"{state.stage.name} failed on {item!r}: {exc}", exc_info=True)
+            return StageError(state.stage.name, item, exc)
+        finally:
+            state.finish()
+
+    def _work(self, index: int, finished: "_Countdown") -> None:
+        """Worker thread of a stage. """
+        source = self._queues[index]
+        while True:
+            item = source.get()
+            if item is _END:
+                # Let the rest of the workers of the stage see it.
+                source.put(_END)
+                finished.done()
+                return
+            if not self._stop.is_set():
+                self._put(index + 1, self._apply(index, item))
+
+    def _dispatch(self, index: int) -> None:
+        """Submit the items of a stage to its process pool, as many at once as
+        workers, so the items wait in the (bounded) queue instead of the pool.
+        """
+        state = self._states[index]
+        slots = threading.Semaphore(state.stage.workers)
+
+        def on_done(future: Future, item: Any) -> None:
+            try:
+                output = future.result()
+            except Exception as exc:
+                logger.error(
+                    f"{state.stage.name} failed on {item!r}: {exc}", exc_info=True
+                )
+                output = StageError(state.stage.name, item, exc)
+            state.finish()
+            slots.release()
+            self._put(index + 1, output)
+
+        source = self._queues[index]
+        executor = process_pool(state.stage.workers)
+        try:
+            while True:
+                item = source.get()
+                if item is _END or self._stop.is_set():
+                    break
+                slots.acquire()
+                state.start()
+                try:
+                    future = executor.submit(state.stage.function, item)
+                except BrokenProcessPool:
+                    # A worker died (i.e. killed by the OOM killer), the items it
+                    # was running fail with a StageError. Restart the pool for
+                    # the rest.
+                    logger.warning(f"{state.stage.name} process pool broken, restarting.")
+                    executor.shutdown(wait=True)
+                    executor = process_pool(state.stage.workers)
+                    future = executor.submit(state.stage.function, item)
+                future.add_done_callback(lambda future, item=item: on_done(future, item))
+        finally:
+            executor.shutdown(wait=True)
+            self._end(index)
+
+    def _monitor(self) -> None:
+        """Sample the busy workers, and report the status periodically. """
+        last_report = time.monotonic()
+        while not self._stop.wait(0.5):
+            for state in self._states:
+                state.sample()
+            if (
+                self.report_every is not None
+                and time.monotonic() - last_report >= self.report_every
+            ):
+                self.report(self.format_status())
+                last_report = time.monotonic()
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool whose workers are started from a forkserver. """
+    # Forking a process with threads running may copy locks held by them.
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('forkserver')
+    )
+
+
+class _Countdown:
+    """Calls a function when the last of a number of workers is done. """
+    def __init__(self, count: int, callback: Callable[[], None]):
+        self._count = count
+        self._callback = callback
+        self._lock = threading.Lock()
+
+    def done(self) -> None:
+        with self._lock:
+            self._count -= 1
+            last = self._count == 0
+        if last:
+            self._callback()
@@ -0,0 +1,445 @@
+"""Asynchronous client for the PyPI JSON API.
+
+get_package_source opens a new connection for every package, the client in this
+module fetches the metadata of many packages at once, reusing a pool of
+keep-alive connections, with a bound on the requests in flight and retries with
+exponential backoff.
+
+The responses go through a mc.MetadataCache, so warm runs only send requests
+for the entries older than its TTL (revalidated with their ETag).
+
+The base url can be pointed to any server answering /<package>/json, i.e. a
+local http.server serving canned responses for testing (along with a cache on a
+temporary file).
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import random
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union
+)
+
+import src.data.download as dwn
+import src.data.metadata_cache as mc
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+Metadata = Dict[str, Any]
+Response = Tuple[int, Dict[str, str], bytes]
+Connection = Union[http.client.HTTPConnection, http.client.HTTPSConnection]
+
+# Responses worth retrying, anything else is returned as is.
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+# Redirects followed by MetadataClient.fetch, i.e. from a non canonical name
+# (/pyyaml/json to /PyYAML/json), up to MAX_REDIRECTS times.
+REDIRECT_STATUS = frozenset({301, 302, 307, 308})
+MAX_REDIRECTS = 5
+
+
+class MetadataError(Exception):
+    """Error raised when the metadata of a package couldn't be obtained. """
+    def __init__(self, package: str, reason: str):
+        self.package = package
+        self.reason = reason
+        self.msg: str = "Metadata couldn't be obtained"
+        super().__init__(self.msg)
+
+    def __str__(self):
+        return f"{self.msg}: {self.package} ({self.reason})"
+
+
+class ConnectionPool:
+    """Pool of keep-alive connections to a single host.
+
+    The connections are blocking (http.client), each request runs on a thread of
+    an executor with as many threads as connections, and at most `size`
+    requests are in flight at the same time.
+    """
+    def __init__(self, base_url: str, size: int = 16, timeout: float = 30):
+        """
+        Parameters
+        ----------
+        base_url : str
+            Url of the api, the path is prepended to every request.
+        size : int
+            Maximum number of connections. Defaults to 16.
+        timeout : float
+            Timeout of the socket operations in seconds. Defaults to 30.
+        """
+        parts = urllib.parse.urlsplit(base_url)
+        if parts.scheme == 'https':
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+        self._host: str = parts.hostname
+        self._port: Optional[int] = parts.port
+        self._prefix: str = parts.path.rstrip('/')
+        self._timeout = timeout
+        self._idle: List[Connection] = []
+        self._semaphore = asyncio.Semaphore(size)
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self._host}{self._prefix})"
+
+    def relative_path(self, path: str, location: str) -> Optional[str]:
+        """Path relative to the base url of the Location of a redirect from
+        path, None when it points to another host or outside the base url.
+        """
+        base = f"{self._host}:{self._port}" if self._port else self._host
+        url = urllib.parse.urlsplit(
+            urllib.parse.urljoin(f"http://{base}{self._prefix}{path}", location)
+        )
+        if url.hostname != self._host or url.port != self._port:
+            return
+        if not url.path.startswith(self._prefix + '/'):
+            return
+        return url.path[len(self._prefix):] + (f"?{url.query}" if url.query else '')
+
+    def _connect(self) -> Connection:
+        return self._connection_class(self._host, self._port, timeout=self._timeout)
+
+    def _send(
+            self,
+            connection: Connection,
+            path: str,
+            headers: Dict[str, str]
+    ) -> Response:
+        connection.request('GET', self._prefix + path, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        response_headers = {key.lower(): value for key, value in response.getheaders()}
+        return response.status, response_headers, body
+
+    async def request(
+            self,
+            path: str,
+            headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        """Send a GET request on one of the idle connections (or a new one).
+
+        Parameters
+        ----------
+        path : str
+            Path of the resource, relative to the base url.
+        headers : Dict[str, str], optional
+            Headers of the request.
+
+        Returns
+        -------
+        response : Response
+            Status, headers (lower case names) and body of the response.
+        """
+        async with self._semaphore:
+            connection = self._idle.pop() if self._idle else self._connect()
+            loop = asyncio.get_running_loop()
+            try:
+                response = await loop.run_in_executor(
+                    self._executor, self._send, connection, path, headers or {}
+                )
+            except BaseException:
+                # The state of the connection is unknown, don't reuse it.
+                connection.close()
+                raise
+            if response[1].get('connection', '').lower() == 'close':
+                connection.close()
+            else:
+                self._idle.append(connection)
+            return response
+
+    def close(self) -> None:
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
+        self._executor.shutdown(wait=False)
+
+
+class MetadataClient:
+    """Client of the PyPI JSON API.
+
+    Examples
+    --------
+    >>> async def main():
+    ...     async with MetadataClient(concurrency=32) as client:
+    ...         return await client.resolve_sources(['click', 'six'])
+    >>> asyncio.run(main())
+    {'click': 'https://files.pythonhosted.org/.../click-8.0.3.tar.gz',...
+
+    Against a local server:
+
+    >>> MetadataClient(base_url='http://127.0.0.1:8000/pypi')
+    """
+    def __init__(
+            self,
+            base_url: str = dwn.PYPI_INSTANCE,
+            concurrency: int = 16,
+            retries: int = 3,
+            backoff: float = 0.5,
+            timeout: float = 30,
+            cache: Optional[mc.MetadataCache] = None
+    ):
+        """
+        Parameters
+        ----------
+        base_url : str
+            Url of the api. Defaults to dwn.PYPI_INSTANCE.
+        concurrency : int
+            Maximum number of requests in flight (and connections).
+            Defaults to 16.
+        retries : int
+            Number of times a request is retried after a connection error or a
+            retryable status (see RETRY_STATUS). Defaults to 3.
+        backoff : float
+            Seconds waited before the first retry, doubled on each retry.
+            Defaults to 0.5.
+        timeout : float
+            Timeout of the socket operations in seconds. Defaults to 30.
+        cache : mc.MetadataCache, optional
+            Cache of the metadata. Defaults to the cache at cte.METADATA_CACHE.
+        """
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache if cache is not None else mc.default_cache()
+        self._pool: Optional[ConnectionPool] = None
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.base_url})"
+
+    async def __aenter__(self) -> "MetadataClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def pool(self) -> ConnectionPool:
+        # Created lazily, so it belongs to the running event loop.
+        if self._pool is None:
+            self._pool = ConnectionPool(self.base_url, self.concurrency, self.timeout)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    async def get(self, path: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        """Send a GET request, retrying with exponential backoff.
+
+        Parameters
+        ----------
+        path : str
+            Path of the resource, relative to the base url.
+        headers : Dict[str, str], optional
+            Headers of the request.
+
+        Returns
+        -------
+        response : Response
+            Status, headers and body of the last attempt.
+
+        Raises
+        ------
+        OSError, http.client.HTTPException
+            When every attempt failed with a connection error.
+        """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self.pool.request(path, headers)
+            except (OSError, http.client.HTTPException) as exc:
+                if last:
+                    raise
+                logger.warning(f"Request to {path} failed ({exc!r}), retrying.")
+            else:
+                if response[0] not in RETRY_STATUS or last:
+                    return response
+                logger.warning(f"Request to {path} returned {response[0]}, retrying.")
+            # Add some jitter so the retries don't arrive at once.
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random() / 2))
+
+    async def fetch(self, package: str) -> Metadata:
+        """Obtain the metadata of a package.
+
+        Parameters
+        ----------
+        package : str
+            Name of the package.
+
+        Returns
+        -------
+        metadata : Metadata
+            Content of /<package>/json, trimmed by mc.trim_metadata.
+
+        Raises
+        ------
+        MetadataError
+            When the request failed or the response is not a 200 (or a 304 for
+            a cached entry).
+
+        Notes
+        -----
+        Redirects (see REDIRECT_STATUS) are followed, the metadata is cached
+        under the name requested.
+        """
+        entry = self.cache.get(package)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry.metadata
+
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        path = f"/{package}/json"
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                status, response_headers, body = await self.get(path, headers)
+            except (OSError, http.client.HTTPException) as exc:
+                raise MetadataError(package, repr(exc)) from exc
+            if status not in REDIRECT_STATUS:
+                break
+            location = response_headers.get('location')
+            path = location and self.pool.relative_path(path, location)
+            if not path:
+                raise MetadataError(package, f"redirect {status} to {location}")
+        else:
+            raise MetadataError(package, f"more than {MAX_REDIRECTS} redirects")
+
+        if status == 304 and entry is not None:
+            self.cache.revalidated(package)
+            return entry.metadata
+        if status != 200:
+            raise MetadataError(package, f"status {status}")
+        metadata = mc.trim_metadata(json.loads(body))
+        self.cache.put(package, metadata, response_headers.get('etag'))
+        return metadata
+
+    async def fetch_many(self, packages: Iterable[str]) -> Dict[str, Optional[Metadata]]:
+        """Obtain the metadata of multiple packages concurrently.
+
+        Parameters
+        ----------
+        packages : Iterable[str]
+            Names of the packages.
+
+        Returns
+        -------
+        metadata : Dict[str, Optional[Metadata]]
+            Metadata by package, None for the packages that failed.
+        """
+        packages = list(dict.fromkeys(packages))
+
+        async def safe_fetch(package: str) -> Optional[Metadata]:
+            try:
+                return await self.fetch(package)
+            except MetadataError as exc:
+                logger.error(str(exc))
+
+        results = await asyncio.gather(*(safe_fetch(package) for package in packages))
+        return dict(zip(packages, results))
+
+    async def resolve_sources(
+            self,
+            packages: Iterable[str],
+            version: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """Obtain the url of the sdist of multiple packages.
+
+        Parameters
+        ----------
+        packages : Iterable[str]
+            Names of the packages.
+        version : str, optional
+            Version of the releases, the latest when None.
+
+        Returns
+        -------
+        sources : Dict[str, Optional[str]]
+            Url of the sdist by package, None when not found.
+        """
+        sources: Dict[str, Optional[str]] = {}
+        for package, metadata in (await self.fetch_many(packages)).items():
+            sources[package] = None
+            if metadata is None:
+                continue
+            try:
+                sources[package] = dwn.select_source(metadata, package, version)
+            except ValueError as exc:
+                logger.error(str(exc))
+        return sources
+
+
+def get_latest_releases(
+        packages: Iterable[str],
+        **kwargs
+) -> Dict[str, Optional[dwn.Release]]:
+    """Batch version of dwn.latest_release.
+
+    Parameters
+    ----------
+    packages : Iterable[str]
+        Names of the packages.
+    kwargs
+        Passed to MetadataClient.
+
+    Returns
+    -------
+    releases : Dict[str, Optional[dwn.Release]]
+        Latest release by package, None when the metadata couldn't be obtained.
+    """
+    async def resolve() -> Dict[str, Optional[Metadata]]:
+        async with MetadataClient(**kwargs) as client:
+            return await client.fetch_many(packages)
+
+    return {
+        package: None if metadata is None else dwn.latest_release(metadata, package)
+        for package, metadata in asyncio.run(resolve()).items()
+    }
+
+
+def get_package_sources(
+        packages: Iterable[str],
+        version: Optional[str] = None,
+        **kwargs
+) -> Dict[str, Optional[str]]:
+    """Batch version of dwn.get_package_source.
+
+    Parameters
+    ----------
+    packages : Iterable[str]
+        Names of the packages.
+    version : str, optional
+        Version of the releases, the latest when None.
+    kwargs
+        Passed to MetadataClient.
+
+    Returns
+    -------
+    sources : Dict[str, Optional[str]]
+        Url of the sdist by package, None when not found.
+
+    Examples
+    --------
+    >>> get_package_sources(dwn.get_top_packages()[:100], concurrency=32)
+    {'urllib3': 'https://files.pythonhosted.org/.../urllib3-1.26.7.tar.gz',...
+    """
+    async def resolve() -> Dict[str, Optional[str]]:
+        async with MetadataClient(**kwargs) as client:
+            return await client.resolve_sources(packages, version)
+
+    return asyncio.run(resolve())
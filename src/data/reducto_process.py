@@ -1,28 +1,53 @@
 """Contains the functionalities to install the libraries and run reducto on them.
 """
 
+import collections
+import contextlib
+import csv
 import difflib
+import functools
+import os
 from typing import (
+    Counter,
+    Dict,
+    Iterator,
     List,
+    NamedTuple,
+    Optional,
+    Tuple,
     Union
 )
 import pathlib
-import sys
+import re
+import zipfile
 import subprocess
 import shutil
 import logging
 import json
+import tempfile
 
 import reducto.package as pkg
 import reducto.src as src_
 import reducto.reports as rp
 
 import src.constants as cte
+import src.data.download as dwn
+import src.data.limits as lim
+import src.data.pip_pool as pp
+import src.data.stages as st
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Entries of the target folder which are never the package.
+NON_PACKAGE_SUFFIXES = ('.dist-info', '.egg-info', '.data')
+NON_PACKAGE_ENTRIES = frozenset({'bin', '__pycache__'})
+# Affixes of distribution names usually absent from the import name
+# (PyYAML -> yaml, python-dateutil -> dateutil).
+NAME_PREFIXES = ('python-', 'py-', 'py')
+NAME_SUFFIXES = ('-python', '-py')
+
 
 class PackageNameNotFound(Exception):
     """Error raised when a package could not be found for the distributions
@@ -37,93 +62,653 @@ class PackageNameNotFound(Exception):
         return f"{self.msg}: {self.package}"
 
 
+class Workspace:
+    """Scratch folders private to the processing of a single package.
+
+    Creates a fresh temporary directory (on tmpfs when available, see cte.SCRATCH)
+    containing a folder for the distribution installed via pip and another one
+    for the reducto report. Nothing is shared between packages, so leftovers
+    from a previous package can't alter the candidates found, and packages can
+    be processed concurrently. The whole directory is removed when disposed.
+
+    Examples
+    --------
+    >>> with Workspace('click') as workspace:
+    ...     install('click', workspace)
+    ...     target = find_package('click', workspace)
+    """
+    def __init__(self, package: str, root: Optional[pathlib.Path] = cte.SCRATCH):
+        """
+        Parameters
+        ----------
+        package : str
+            Name of the package, used as prefix of the directory.
+        root : pathlib.Path, optional
+            Directory where the workspace is created. When None, the default
+            temporary directory is used.
+        """
+        self.package = package
+        self._path = pathlib.Path(tempfile.mkdtemp(prefix=f"{package}-", dir=root))
+        self._candidates: Optional[Candidates] = None
+        self.distributions.mkdir()
+        self.reports.mkdir()
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.path})"
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.dispose()
+
+    @property
+    def path(self) -> pathlib.Path:
+        """Root directory of the workspace. """
+        return self._path
+
+    @property
+    def distributions(self) -> pathlib.Path:
+        """Directory where the package is installed. """
+        return self.path / 'distributions'
+
+    @property
+    def reports(self) -> pathlib.Path:
+        """Directory where the reducto report is written. """
+        return self.path / 'reducto_reports'
+
+    def candidates(self) -> "Candidates":
+        """Entries of the distributions folder, scanned again only when the
+        folder was modified since the last call.
+        """
+        mtime_ns = self.distributions.stat().st_mtime_ns
+        if self._candidates is None or self._candidates.mtime_ns != mtime_ns:
+            self._candidates = Candidates(self.distributions)
+        return self._candidates
+
+    def dispose(self) -> None:
+        """Remove the workspace and everything in it. """
+        shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f'Workspace removed: {self.path}')
+
+
+class Entry(NamedTuple):
+    """Entry of a directory, as obtained from os.scandir. """
+    path: pathlib.Path
+    is_dir: bool
+    mtime_ns: int
+
+
+def _scan(directory: pathlib.Path) -> List[Entry]:
+    entries: List[Entry] = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                mtime_ns = entry.stat().st_mtime_ns
+                entries.append(Entry(pathlib.Path(entry.path), entry.is_dir(), mtime_ns))
+            except OSError:
+                continue
+    return entries
+
+
+# The paths are inside workspaces, never seen again once the package is
+# processed: the caches only need to hold the entries of the current ones.
+_CHECKS_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=_CHECKS_CACHE_SIZE)
+def _validate(path: str, mtime_ns: int) -> bool:
+    """Whether reducto accepts a path as a package or a source file.
+
+    Memoized by path and modification time (the most recent ones), so a path
+    is validated again only when it changes.
+    """
+    candidate = pathlib.Path(path)
+    try:
+        return not pkg.Package.validate(candidate)
+    except pkg.PackageError:
+        pass
+    try:
+        return not src_.SourceFile.validate(candidate)
+    except src_.SourceFileError:
+        return False
+
+
+@functools.lru_cache(maxsize=_CHECKS_CACHE_SIZE)
+def _has_python_files(path: str, mtime_ns: int) -> bool:
+    """Whether a directory contains python files, memoized like _validate. """
+    with os.scandir(path) as it:
+        return any(entry.name.endswith('.py') and entry.is_file() for entry in it)
+
+
+class Candidates:
+    """Entries of the folder where a distribution was installed, obtained with a
+    single os.scandir pass.
+
+    The checks on the entries are memoized per path and modification time, so
+    asking again for the candidates (i.e. on the fallback of
+    make_dataset._process_package) costs nothing. Obtain them with
+    Workspace.candidates.
+
+    Examples
+    --------
+    >>> candidates = workspace.candidates()
+    >>> candidates.valid  # Accepted by reducto, see distribution_candidates.
+    [PosixPath('/dev/shm/click-k2j4l_0x/distributions/click')]
+    >>> candidates.sources  # Python packages or modules.
+    [PosixPath('/dev/shm/click-k2j4l_0x/distributions/click')]
+    """
+    def __init__(self, root: pathlib.Path):
+        """
+        Parameters
+        ----------
+        root : pathlib.Path
+            Folder where the distribution was installed.
+        """
+        self.root = root
+        self.mtime_ns: int = root.stat().st_mtime_ns
+        self.entries: List[Entry] = _scan(root)
+        self._valid: Optional[List[pathlib.Path]] = None
+        self._sources: Optional[List[pathlib.Path]] = None
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self.root}, entries={len(self.entries)})"
+
+    def __iter__(self) -> Iterator[pathlib.Path]:
+        return iter(self.valid)
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def __getitem__(self, index: int) -> pathlib.Path:
+        return self.valid[index]
+
+    @property
+    def valid(self) -> List[pathlib.Path]:
+        """Entries accepted by reducto as a package or a source file.
+
+        When a directory is not valid, its subdirectories are checked, in case an
+        inner package is found like in google-auth (google/auth), see
+        https://pypi.org/project/google-auth/
+        """
+        if self._valid is None:
+            self._valid = []
+            for entry in self.entries:
+                if _validate(str(entry.path), entry.mtime_ns):
+                    self._valid.append(entry.path)
+                elif entry.is_dir:
+                    self._valid.extend(
+                        sub.path for sub in _scan(entry.path)
+                        if sub.is_dir and _validate(str(sub.path), sub.mtime_ns)
+                    )
+        return self._valid
+
+    @property
+    def sources(self) -> List[pathlib.Path]:
+        """Python packages (directories with python files) and modules, sorted
+        by name.
+        """
+        if self._sources is None:
+            self._sources = sorted(
+                entry.path for entry in self.entries if _is_source_entry(entry)
+            )
+        return self._sources
+
+
+def _is_source_entry(entry: Entry) -> bool:
+    name = entry.path.name
+    if name in NON_PACKAGE_ENTRIES or name.endswith(NON_PACKAGE_SUFFIXES):
+        return False
+    if entry.is_dir:
+        return _has_python_files(str(entry.path), entry.mtime_ns)
+    return name.endswith('.py')
+
+
 def install(
         package: Union[pathlib.Path, str],
-        target: pathlib.Path = cte.DISTRIBUTIONS
+        workspace: Workspace,
+        limits: lim.Limits = lim.Limits(),
+        pool: Optional[pp.PipPool] = None
 ) -> None:
     r"""Installs a package in a given target.
 
-    Tries to install a package using pip.
+    Tries to install a package using pip, on one of the workers of
+    pp.default_pool (so the interpreter and pip are not started every time).
 
     Runs a command like the following:
-    python -m pip install --no-deps --target
-    /home/agustin/github_repos/top_pypi_source_code_stats/data/interim/
+    pip install --no-deps --target
+    /dev/shm/black-k2j4l_0x/distributions
     /home/agustin/github_repos/top_pypi_source_code_stats/data/raw/black-21.8b0/
 
     Parameters
     ----------
     package : pathlib.Path
         Package to install. dist-info.
-    target : pathlib.Path
-        Directory where the package is installed.
+    workspace : Workspace
+        Workspace where the package is installed.
+    limits : lim.Limits
+        Timeout, memory and cpu limits of the install. Unlimited by default.
+    pool : pp.PipPool, optional
+        Pool running the install. Defaults to pp.default_pool.
+
+    Raises
+    ------
+    pp.InstallError
+        When pip fails, with its returncode and output (and the reason 'timeout'
+        or 'oom' when it ran over the limits).
 
     Examples
     --------
-    >>> install(cte.RAW / 'black-21.8b0')
+    >>> install(cte.RAW / 'black-21.8b0', workspace)
 
     or
 
-    >>> install('black')
+    >>> install('black', workspace)
     """
-    if isinstance(target, pathlib.Path):
-        if not target.is_dir():
-            target.mkdir()
-
-    args: List[str] = [
-        sys.executable,
-        "-m",
-        "pip",
-        "install",
+    options: List[str] = [
         "--no-deps",
         "--upgrade",  # During test, overwrite if already present
         "-t",
-        str(target),
-        str(package),
+        str(workspace.distributions),
     ]
+    pool = pool if pool is not None else pp.default_pool()
+    pool.install(
+        str(package), options,
+        timeout=limits.timeout, memory=limits.memory, cpu=limits.cpu
+    )
+
+
+class Artifact(NamedTuple):
+    """File to install a package from, as obtained by fetch_package. """
+    source: Union[pathlib.Path, str]  # Wheel or sdist, or the name for pip.
+    wheel: bool  # Pure python wheel, installed by unpacking it.
+    release: Optional[dwn.Release] = None
+
+
+def fetch_package(package: str, timer: Optional[st.StageTimer] = None) -> Artifact:
+    """Obtain the file to install a package from, through the artifact store.
+
+    The pure python wheel when the package has one (installed without running
+    pip nor the build backend), otherwise the sdist (see source_artifact).
+
+    Parameters
+    ----------
+    package : str
+        Name of the package.
+    timer : st.StageTimer, optional
+        Timer of the 'download' stage.
+
+    Returns
+    -------
+    artifact : Artifact
+    """
+    timer = timer if timer is not None else st.StageTimer()
+    with timer.stage('download'):
+        artifact = _fetch_package(package)
+    if isinstance(artifact.source, pathlib.Path):
+        timer.add_bytes('download', st.path_size(artifact.source))
+    return artifact
+
+
+def _fetch_package(package: str) -> Artifact:
     try:
-        subprocess.check_output(args)
-    except subprocess.CalledProcessError as exc:
-        raise exc.output
+        metadata = dwn.get_package_metadata(package)
+        release = dwn.latest_release(metadata, package)
+        wheel = dwn.select_wheel_file(metadata, package)
+        if wheel is not None:
+            path = dwn.fetch_artifact(wheel, package, release.version)
+            return Artifact(path, True, release)
+    except (lim.StepTimeout, MemoryError):
+        raise
+    except Exception as exc:
+        logger.warning(f"Wheel of {package} not obtained ({exc}), using pip.")
+    return source_artifact(package)
+
+
+def install_artifact(
+        package: str,
+        artifact: Artifact,
+        workspace: Workspace,
+        limits: lim.Limits = lim.Limits(),
+        timer: Optional[st.StageTimer] = None,
+        pool: Optional[pp.PipPool] = None,
+        limit_wheel: bool = False
+) -> Tuple[str, Artifact]:
+    """Installs a package from the artifact obtained by fetch_package.
+
+    A wheel is just unpacked, the rest are installed with pip. When the wheel
+    can't be unpacked, the sdist is installed instead.
+
+    Parameters
+    ----------
+    package : str
+        Name of the package.
+    artifact : Artifact
+        Wheel, sdist or name of the package.
+    workspace : Workspace
+        Workspace where the package is installed.
+    limits : lim.Limits
+        Limits of the pip install, applied by the pool.
+    timer : st.StageTimer, optional
+        Timer of the 'install' stage, the bytes installed are added to it.
+    pool : pp.PipPool, optional
+        Pool running the pip install, see install.
+    limit_wheel : bool
+        Whether to unpack the wheel (and download the sdist when it can't be
+        unpacked) under the limits too, see lim.limited. Defaults to False.
+
+    Returns
+    -------
+    method : str
+        'wheel' or 'pip'.
+    installed : Artifact
+        The artifact installed, the sdist when the wheel couldn't be unpacked.
+        Its release is the one analyzed.
+    """
+    def limited(step: str):
+        return lim.limited(step, limits) if limit_wheel else contextlib.nullcontext()
+
+    timer = timer if timer is not None else st.StageTimer()
+    method = 'pip'
+    if artifact.wheel:
+        try:
+            with limited('install'):
+                with timer.stage('install'), zipfile.ZipFile(artifact.source) as archive:
+                    archive.extractall(workspace.distributions)
+            method = 'wheel'
+        except (lim.StepTimeout, MemoryError):
+            raise
+        except Exception as exc:
+            logger.warning(
+                f"Wheel of {package} couldn't be installed ({exc}), using pip."
+            )
+            clean_folder(workspace.distributions)
+            with timer.stage('download'), limited('download'):
+                artifact = source_artifact(package)
+
+    if method == 'pip':
+        with timer.stage('install'):
+            install(artifact.source, workspace, limits, pool)
+    timer.add_bytes('install', st.path_size(workspace.distributions))
+    return method, artifact
+
+
+def source_artifact(package: str) -> Artifact:
+    """Obtain the sdist of a package through the artifact store, to install it
+    with pip without downloading it again.
+
+    Parameters
+    ----------
+    package : str
+        Name of the package.
+
+    Returns
+    -------
+    artifact : Artifact
+        With the path of the sdist and its release, or the name of the package
+        and no release when it couldn't be obtained (so pip looks for it).
+    """
+    try:
+        metadata = dwn.get_package_metadata(package)
+        source = dwn.select_source_file(metadata, package)
+        version = metadata["info"]["version"]
+        path = dwn.fetch_artifact(source, package, version)
+        return Artifact(path, False, dwn.Release(version, source["digests"]["sha256"]))
+    except (lim.StepTimeout, MemoryError):
+        raise
+    except Exception as exc:
+        logger.warning(f"sdist of {package} not obtained ({exc}), pip will look for it.")
+        return Artifact(package, False)
+
+
+def acquire(
+        package: str,
+        workspace: Workspace,
+        limits: lim.Limits = lim.Limits(),
+        timer: Optional[st.StageTimer] = None
+) -> Tuple[str, Artifact]:
+    """Installs a package, from its pure python wheel when available, otherwise
+    with pip (fetch_package followed by install_artifact).
+
+    Parameters
+    ----------
+    package : str
+        Name of the package.
+    workspace : Workspace
+        Workspace where the package is installed.
+    limits : lim.Limits
+        Limits of the download and the install, each one applied separately.
+        The pip install is limited by its pool, which kills the worker and the
+        processes it started, instead of a signal on this process.
+    timer : st.StageTimer, optional
+        Timer of the 'download' and 'install' stages, the bytes installed are
+        added to the latter.
+
+    Returns
+    -------
+    method : str
+        'wheel' or 'pip'.
+    installed : Artifact
+        The artifact installed, see install_artifact.
+
+    Raises
+    ------
+    lim.StepTimeout, MemoryError
+        When the download or the wheel install run over the limits.
+    Exception
+        Whatever install raises when pip fails.
+
+    Notes
+    -----
+    The wheel or sdist are read from the artifact store, see dwn.fetch_artifact.
+    """
+    with lim.limited('download', limits):
+        artifact = fetch_package(package, timer)
+    return install_artifact(package, artifact, workspace, limits, timer, limit_wheel=True)
+
+
+def record_packages(workspace: Workspace) -> List[pathlib.Path]:
+    """Obtain the packages (or modules) installed according to the RECORD files
+    of the *.dist-info folders.
 
+    Parameters
+    ----------
+    workspace : Workspace
+        Workspace where the distribution was installed.
 
-def distribution_candidates() -> List[pathlib.Path]:
+    Returns
+    -------
+    packages : List[pathlib.Path]
+        Top level packages and modules, the folders without python files
+        (i.e. bin) are left out.
+    """
+    packages: List[pathlib.Path] = []
+    for record in sorted(workspace.distributions.glob('*.dist-info/RECORD')):
+        with open(record, newline='') as f:
+            paths = [pathlib.PurePosixPath(row[0]) for row in csv.reader(f) if row]
+        for top in dict.fromkeys(path.parts[0] for path in paths if path.parts):
+            if top.endswith(('.dist-info', '.data')) or top in ('..', '__pycache__'):
+                continue
+            candidate = workspace.distributions / top
+            is_module = top.endswith('.py') and candidate.is_file()
+            is_package = candidate.is_dir() and any(
+                path.parts[0] == top and path.suffix == '.py' for path in paths
+            )
+            if (is_module or is_package) and candidate not in packages:
+                packages.append(candidate)
+    return packages
+
+
+def distribution_candidates(workspace: Workspace) -> List[pathlib.Path]:
     """Obtain the distribution candidates to be passed to find_distribution.
 
-    Check possible candidates to be fed to reducto
+    Check possible candidates to be fed to reducto, see Candidates.valid.
+
+    Parameters
+    ----------
+    workspace : Workspace
+        Workspace where the distribution was installed.
 
     Returns
     -------
     candidates : List[pathlib.Path]
         List of packages contained in a distribution.
     """
-    candidates: List[pathlib.Path] = []
-    for path in cte.DISTRIBUTIONS.iterdir():
-        try:
-            if not pkg.Package.validate(path):
-                candidates.append(path)
-        except pkg.PackageError:
-            try:
-                if not src_.SourceFile.validate(path):
-                    candidates.append(path)
-            except src_.SourceFileError as e:
-                # One last attempt in case an inner package like in google-auth is found:
-                # See package definition for:
-                # https://pypi.org/project/google-auth/
-                if path.is_dir():
-                    for subpath in path.iterdir():
-                        try:
-                            if not pkg.Package.validate(subpath):
-                                candidates.append(subpath)
-                        except pkg.PackageError:
-                            pass
-        #
-        # except Exception as exc:
-        #     logger.warning('No packages where found')
-
-    return candidates
-
-
-def find_package(package: str) -> pathlib.Path:
+    return workspace.candidates().valid
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a distribution name as in PEP 503.
+
+    Examples
+    --------
+    >>> normalize_name('Flask_SQLAlchemy')
+    'flask-sqlalchemy'
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def name_variants(package: str) -> List[str]:
+    """Normalized names the importable package of a distribution may have.
+
+    Examples
+    --------
+    >>> name_variants('PyYAML')
+    ['pyyaml', 'yaml']
+    """
+    name = normalize_name(package)
+    variants: List[str] = [name]
+    for prefix in NAME_PREFIXES:
+        if name.startswith(prefix) and len(name) > len(prefix):
+            variants.append(name[len(prefix):])
+    for suffix in NAME_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            variants.append(name[:-len(suffix)])
+    return list(dict.fromkeys(variants))
+
+
+def _is_source(path: pathlib.Path) -> bool:
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    return _is_source_entry(Entry(path, path.is_dir(), stat.st_mtime_ns))
+
+
+def metadata_packages(workspace: Workspace) -> List[pathlib.Path]:
+    """Obtain the top level packages declared in the metadata of the installed
+    distribution, the top_level.txt files and the RECORD files.
+
+    Parameters
+    ----------
+    workspace : Workspace
+        Workspace where the distribution was installed.
+
+    Returns
+    -------
+    packages : List[pathlib.Path]
+    """
+    packages: List[pathlib.Path] = []
+    for top_level in sorted(workspace.distributions.glob('*-info/top_level.txt')):
+        for name in top_level.read_text(errors='ignore').split():
+            for candidate in (
+                    workspace.distributions / name,
+                    workspace.distributions / (name + '.py')
+            ):
+                if _is_source(candidate):
+                    packages.append(candidate)
+    packages.extend(record_packages(workspace))
+    return list(dict.fromkeys(packages))
+
+
+class Resolution(NamedTuple):
+    """Package found by resolve_package, and the strategy which found it. """
+    path: pathlib.Path
+    strategy: str
+
+
+# Number of packages resolved by each strategy in this process.
+resolution_counts: Counter[str] = collections.Counter()
+
+
+def resolve_package(package: str, workspace: Workspace) -> Resolution:
+    """After installing a package, find the directory/file containing the code to be
+    parsed by reducto.
+
+    The strategies are tried in order:
+    - 'exact': a normalized variant of the name (see name_variants) is a top
+        level package, declared in the metadata or found in the target folder.
+        i.e. PyYAML -> yaml.
+    - 'namespace': the parts of the name are a nested package,
+        i.e. google-auth -> google/auth, google-api-core -> google/api_core.
+    - 'metadata': the metadata declares a single public top level package,
+        i.e. beautifulsoup4 -> bs4.
+    - 'fuzzy': closest name according to difflib.
+
+    Parameters
+    ----------
+    package : str
+        Name of the package as stored top-pypi-packages.
+    workspace : Workspace
+        Workspace where the distribution was installed.
+
+    Returns
+    -------
+    resolution : Resolution
+        Path to be passed to run_reducto, and the strategy used. The strategies
+        used in the process are counted in resolution_counts.
+
+    Raises
+    ------
+    PackageNameNotFound
+        When no strategy found the package.
+
+    Examples
+    --------
+    >>> resolve_package('PyYAML', workspace)
+    Resolution(path=PosixPath('/dev/shm/PyYAML-k2j4l_0x/distributions/yaml'),
+               strategy='exact')
+    """
+    declared = metadata_packages(workspace)
+    index: Dict[str, pathlib.Path] = {}
+    for candidate in declared + workspace.candidates().sources:
+        index.setdefault(normalize_name(candidate.stem), candidate)
+
+    resolution: Optional[Resolution] = None
+    variants = name_variants(package)
+    for name in variants:
+        if name in index:
+            resolution = Resolution(index[name], 'exact')
+            break
+
+    if resolution is None:
+        parts = variants[0].split('-')
+        for split in range(len(parts) - 1, 0, -1):
+            nested = workspace.distributions.joinpath(
+                *parts[:split], '_'.join(parts[split:])
+            )
+            if _is_source(nested) or _is_source(nested.with_suffix('.py')):
+                path = nested if nested.is_dir() else nested.with_suffix('.py')
+                resolution = Resolution(path, 'namespace')
+                break
+
+    if resolution is None:
+        public = [path for path in declared if not path.name.startswith('_')]
+        if len(public) == 1:
+            resolution = Resolution(public[0], 'metadata')
+
+    if resolution is None:
+        matches = difflib.get_close_matches(variants[0], list(index))
+        if len(matches) > 0:
+            resolution = Resolution(index[matches[0]], 'fuzzy')
+
+    if resolution is None:
+        raise PackageNameNotFound(package)
+    resolution_counts[resolution.strategy] += 1
+    return resolution
+
+
+def find_package(package: str, workspace: Workspace) -> pathlib.Path:
     r"""After installing a package, find the directory/file containing the code to be
     parsed by reducto.
 
@@ -134,19 +719,14 @@ def find_package(package: str) -> pathlib.Path:
     - One or more packages, i.e.
         pip install PyYAML
 
-    TODO:
-        Needs testing!
-        Use
-        difflib.get_close_matches('black', ['black', 'black_primer', 'blackd', 'blib2to3'])
-        >>> difflib.get_close_matches('yaml', ['PyYAML'])
-        []
-        >>> difflib.get_close_matches('yaml', ['PyYAML'.lower()])
-        ['pyyaml']
+    See resolve_package for the strategies used.
 
     Parameters
     ----------
     package : str
         Name of the package as stored top-pypi-packages.
+    workspace : Workspace
+        Workspace where the distribution was installed.
 
     Returns
     -------
@@ -160,41 +740,65 @@ def find_package(package: str) -> pathlib.Path:
 
     Examples
     --------
-    >>> find_package('click')
-    PosixPath('/home/agustin/github_repos/top_pypi_source_code_stats/data/interim/distributions/click')
+    >>> find_package('click', workspace)
+    PosixPath('/dev/shm/click-k2j4l_0x/distributions/click')
     """
-    candidates: List[pathlib.Path] = distribution_candidates()
-    candidates_lower = [candidate.stem.lower() for candidate in candidates]
-    matches = difflib.get_close_matches(package, candidates_lower)
-    if len(matches) > 0:
-        idx: int = candidates_lower.index(matches[0])
-        return candidates[idx]
-    else:
-        raise PackageNameNotFound(package)
+    return resolve_package(package, workspace).path
 
 
-def run_reducto(
-        target: pathlib.Path,
-        output_path: pathlib.Path = cte.REDUCTO_REPORTS
-) -> None:
-    """Run reducto on a distribution package and store the report on data/interim.
+def analyze(target: pathlib.Path) -> Union[rp.SourceReportType, rp.PackageReportType]:
+    """Obtain the reducto report of a package (or source file) in process.
+
+    Does the same as the reducto console script through its python api, without
+    spawning a process nor writing the report to disk (run_reducto followed by
+    read_reducto_report).
 
     Parameters
     ----------
     target : pathlib.Path
-        Path target to execute reducto against.
-    output_path : pathlib.Path
-        Path where the report from reducto is stored. Defaults to cte.REDUCTO_REPORTS
+        Package (directory) or module (file) to analyze.
+
+    Returns
+    -------
+    report : dict
+        reducto report, as read by read_reducto_report.
+
+    Raises
+    ------
+    PackageNameNotFound
+        When reducto doesn't accept the target as a package or source file.
 
     Examples
     --------
-    >>> target = find_package('click')
-    >>> run_reducto(target)
+    >>> analyze(find_package('click', workspace))
+    {'click': {'lines': 9918, 'number_of_functions': 469,...}
     """
-    if not output_path.is_dir():
-        output_path.mkdir()
+    try:
+        if target.is_dir():
+            reporter = rp.PackageReport(pkg.Package.from_path(target))
+        else:
+            reporter = rp.SourceReport(src_.SourceFile(target))
+    except (pkg.PackageError, src_.SourceFileError) as exc:
+        raise PackageNameNotFound(target.name) from exc
+    return reporter.report()
 
-    output: str = str(output_path / (target.stem + '.json'))
+
+def run_reducto(target: pathlib.Path, workspace: Workspace) -> None:
+    """Run reducto on a distribution package and store the report on the workspace.
+
+    Parameters
+    ----------
+    target : pathlib.Path
+        Path target to execute reducto against.
+    workspace : Workspace
+        Workspace where the report from reducto is stored.
+
+    Examples
+    --------
+    >>> target = find_package('click', workspace)
+    >>> run_reducto(target, workspace)
+    """
+    output: str = str(workspace.reports / (target.stem + '.json'))
     args: List[str] = [
         "reducto",
         str(target),
@@ -209,13 +813,18 @@ def run_reducto(
         raise exc.output
 
 
-def read_reducto_report(package: str) -> Union[rp.SourceReportType, rp.PackageReportType]:
+def read_reducto_report(
+        package: str,
+        workspace: Workspace
+) -> Union[rp.SourceReportType, rp.PackageReportType]:
     """Read the reducto report of a given package.
 
     Parameters
     ----------
     package : str
         Name of the package to download.
+    workspace : Workspace
+        Workspace where run_reducto stored the report.
 
     Returns
     -------
@@ -229,10 +838,10 @@ def read_reducto_report(package: str) -> Union[rp.SourceReportType, rp.PackageRe
 
     Examples
     --------
-    >>> read_reducto_report('click')
+    >>> read_reducto_report('click', workspace)
     {'click': {'lines': 9918, 'number_of_functions': 469,...}
     """
-    report_path: pathlib.Path = cte.REDUCTO_REPORTS / (package + '.json')
+    report_path: pathlib.Path = workspace.reports / (package + '.json')
 
     if report_path.is_file():
         with open(report_path, 'r') as f:
@@ -0,0 +1,163 @@
+"""Order of the packages processed by reducto_reports.
+
+The packages are listed by downloads, so the biggest ones (botocore,
+tensorflow...) may be submitted last and keep a single worker busy while the
+rest are idle. The packages are instead submitted by their predicted cost, the
+largest first (LPT, longest processing time), and the process pool hands the
+next one to whichever worker finishes first, balancing the rest dynamically.
+
+The cost of a package is predicted from the time it took on a previous run (the
+stages stored in reducto_timing), and otherwise from the size of its artifact
+in the cached metadata, at the seconds per byte observed on the packages with
+both.
+"""
+
+import heapq
+import statistics
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional
+)
+
+import src.data.db as db
+import src.data.download as dwn
+import src.data.metadata_cache as mc
+
+
+# Seconds per byte of artifact when there are no timings to fit it.
+DEFAULT_RATE = 1e-6
+
+
+def timing_cost(document: Optional[db.Document]) -> Optional[float]:
+    """Seconds a package took on a previous run, the sum of its stages when
+    stored (see st.StageTimer), otherwise the analysis time.
+    """
+    if document is None:
+        return
+    stages = document.get("stages")
+    if stages:
+        return sum(measures.get("seconds", 0.) for measures in stages.values())
+    return document.get("time")
+
+
+def artifact_size(
+        package: str,
+        cache: Optional[mc.MetadataCache] = None
+) -> Optional[int]:
+    """Bytes of the file analyzed from the latest release of a package (the
+    pure wheel, or the sdist), from the cached metadata only.
+    """
+    cache = cache if cache is not None else mc.default_cache()
+    entry = cache.get(package)
+    if entry is None:
+        return
+    metadata = entry.metadata
+    try:
+        file = (
+            dwn.select_wheel_file(metadata, package)
+            or dwn.select_source_file(metadata, package)
+        )
+    except ValueError:
+        return
+    return file.get("size")
+
+
+def predict_costs(
+        packages: Iterable[str],
+        timings: Dict[str, db.Document],
+        sizes: Dict[str, Optional[int]]
+) -> Dict[str, float]:
+    """Predict the seconds each package will take.
+
+    Parameters
+    ----------
+    packages : Iterable[str]
+        Names of the packages.
+    timings : Dict[str, db.Document]
+        Documents of reducto_timing by package, see timing_cost.
+    sizes : Dict[str, Optional[int]]
+        Bytes of the artifact of each package, see artifact_size.
+
+    Returns
+    -------
+    costs : Dict[str, float]
+        Seconds by package.
+    """
+    packages = list(packages)
+    observed = {pkg: timing_cost(timings.get(pkg)) for pkg in packages}
+    observed = {pkg: cost for pkg, cost in observed.items() if cost is not None}
+    rates = [
+        cost / sizes[pkg] for pkg, cost in observed.items() if sizes.get(pkg)
+    ]
+    rate = statistics.median(rates) if rates else DEFAULT_RATE
+
+    costs: Dict[str, float] = {}
+    unknown: List[str] = []
+    for pkg in packages:
+        if pkg in observed:
+            costs[pkg] = observed[pkg]
+        elif sizes.get(pkg):
+            costs[pkg] = sizes[pkg] * rate
+        else:
+            unknown.append(pkg)
+    # The packages without timing nor size are expected to be typical.
+    default = statistics.median(costs.values()) if costs else 1.
+    costs.update((pkg, default) for pkg in unknown)
+    return costs
+
+
+def lpt_order(costs: Dict[str, float]) -> List[str]:
+    """Packages sorted by decreasing cost. """
+    return sorted(costs, key=costs.__getitem__, reverse=True)
+
+
+def makespan(costs: Iterable[float], workers: int) -> float:
+    """Seconds to run the jobs in the order given, each one started on the first
+    worker available (like a process pool does).
+
+    Examples
+    --------
+    >>> makespan([1, 1, 1, 5], 2)
+    6.0
+    >>> makespan([5, 1, 1, 1], 2)
+    5.0
+    """
+    finish = [0.] * max(workers, 1)
+    for cost in costs:
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+
+def schedule(
+        packages: List[str],
+        database: db.DBStore,
+        workers: int
+) -> List[str]:
+    """Sort the packages to process, the largest predicted first, and print the
+    predicted makespan compared to the download rank order.
+
+    Parameters
+    ----------
+    packages : List[str]
+        Names of the packages, by download rank.
+    database : db.DBStore
+        Instance of DBStore, to read the previous timings.
+    workers : int
+        Number of processes of the run.
+
+    Returns
+    -------
+    ordered : List[str]
+    """
+    timings = database.get_many(packages, 'reducto_timing')
+    sizes = {pkg: artifact_size(pkg) for pkg in packages}
+    costs = predict_costs(packages, timings, sizes)
+    ordered = lpt_order(costs)
+    print(
+        f"Predicted makespan: {makespan((costs[pkg] for pkg in ordered), workers):.0f} s "
+        f"(by rank: {makespan((costs[pkg] for pkg in packages), workers):.0f} s, "
+        f"{len(timings)} of {len(packages)} packages with previous timings)."
+    )
+    return ordered
@@ -0,0 +1,149 @@
+"""Pieces shared by the caches kept in SQLite (see metadata_cache, artifact_store
+and stats_cache).
+
+SQLiteLRU keeps a table with the last access of every entry, and removes the
+least recently used entries when the table grows over a budget (of bytes, or
+of entries). per_process shares an instance inside each process.
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    TypeVar
+)
+
+
+T = TypeVar('T')
+
+
+class SQLiteLRU:
+    """Table of entries by key, along with their last access.
+
+    The subclasses define the table: its name, key and the rest of its columns,
+    and the column with the size of each entry (None to count the entries).
+    Safe to share between threads, and between processes through SQLite locking.
+    """
+    TABLE: str
+    KEY: str
+    COLUMNS: str  # Definition of the columns besides the key and accessed.
+    SIZE: Optional[str] = 'size'
+
+    def __init__(self, database: pathlib.Path):
+        """
+        Parameters
+        ----------
+        database : pathlib.Path
+            Path of the sqlite file, its directory is created if needed.
+        """
+        database = pathlib.Path(database)
+        database.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(database), timeout=30, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                f"{self.KEY} TEXT PRIMARY KEY, {self.COLUMNS}, accessed REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.TABLE}_accessed "
+                f"ON {self.TABLE} (accessed)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT COUNT(*) FROM {self.TABLE}"
+            ).fetchone()[0]
+
+    def _total(self) -> int:
+        """Bytes (or entries) stored. """
+        size = f"COALESCE(SUM({self.SIZE}), 0)" if self.SIZE else "COUNT(*)"
+        return self._connection.execute(
+            f"SELECT {size} FROM {self.TABLE}"
+        ).fetchone()[0]
+
+    def _touch(self, keys: Iterable[str], now: float) -> None:
+        """Mark the entries as recently used. """
+        self._connection.executemany(
+            f"UPDATE {self.TABLE} SET accessed = ? WHERE {self.KEY} = ?",
+            ((now, key) for key in keys)
+        )
+
+    def _remove(self, keys: List[str]) -> None:
+        self._connection.executemany(
+            f"DELETE FROM {self.TABLE} WHERE {self.KEY} = ?", ((key,) for key in keys)
+        )
+
+    def _evict(self, budget: int, slack: int = 0, keep: Optional[str] = None) -> int:
+        """Remove the least recently used entries while over the budget.
+
+        Called holding the lock, inside a transaction.
+
+        Parameters
+        ----------
+        budget : int
+            Bytes (or entries) allowed.
+        slack : int
+            Bytes (or entries) removed beyond the budget, to evict in batches.
+        keep : str, optional
+            Key of an entry never removed, i.e. the one just added.
+
+        Returns
+        -------
+        total : int
+            Bytes (or entries) stored afterwards.
+        """
+        total = self._total()
+        if total <= budget:
+            return total
+
+        evicted: List[str] = []
+        size = self.SIZE or "1"
+        rows = self._connection.execute(
+            f"SELECT {self.KEY}, {size} FROM {self.TABLE} "
+            f"WHERE {self.KEY} IS NOT ? ORDER BY accessed",
+            (keep,)
+        )
+        for key, entry_size in rows:
+            if total <= budget - slack:
+                break
+            evicted.append(key)
+            total -= entry_size
+        rows.close()
+        self._remove(evicted)
+        return total
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def per_process(factory: Callable[[], T]) -> Callable[[], T]:
+    """Function returning an instance of factory shared inside the current
+    process. SQLite connections can't be used by forked processes, so each
+    process creates its own.
+
+    Examples
+    --------
+    >>> _default_cache = per_process(MetadataCache)
+    >>> _default_cache() is _default_cache()
+    True
+    """
+    instances: Dict[int, T] = {}
+
+    def instance() -> T:
+        pid = os.getpid()
+        if pid not in instances:
+            instances[pid] = factory()
+        return instances[pid]
+
+    return instance
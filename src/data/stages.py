@@ -0,0 +1,90 @@
+"""Timings and byte counts of the stages of processing a package.
+
+process_package measures every stage with a StageTimer, and the result is
+stored with the timing of the package (see db.DBStore.upsert_timing):
+
+{'name': 'click', 'time': 0.81, 'stages': {
+    'download': {'seconds': 0.212, 'bytes': 97345},
+    'install': {'seconds': 0.034, 'bytes': 412210},
+    'find_package': {'seconds': 0.001},
+    'analysis': {'seconds': 0.81, 'bytes': 398112},
+    'cleanup': {'seconds': 0.004},
+    'db': {'seconds': 0.0002}
+}}
+
+The stages are summarized by make_dataset profile-report.
+"""
+
+import contextlib
+import os
+import pathlib
+import time
+from typing import (
+    Dict,
+    Iterator,
+    Union
+)
+
+
+Stages = Dict[str, Dict[str, float]]
+
+# Stages in the order they run.
+STAGES = ('download', 'install', 'find_package', 'analysis', 'cleanup', 'db')
+
+
+class StageTimer:
+    """Accumulates the seconds and bytes of each stage of a package.
+
+    Examples
+    --------
+    >>> timer = StageTimer()
+    >>> with timer.stage('download'):
+    ...     archive = dwn.fetch_artifact(source, 'click')
+    >>> timer.add_bytes('download', path_size(archive))
+    >>> timer.as_dict()
+    {'download': {'seconds': 0.212, 'bytes': 97345}}
+    """
+    def __init__(self):
+        self._stages: Stages = {}
+
+    def __repr__(self):
+        return type(self).__name__ + f"({self._stages})"
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the time spent in the body of the context to a stage, even when
+        it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, 'seconds', time.perf_counter() - start)
+
+    def add_bytes(self, name: str, nbytes: int) -> None:
+        """Add the bytes processed to a stage. """
+        self._add(name, 'bytes', nbytes)
+
+    def _add(self, name: str, measure: str, value: float) -> None:
+        stage = self._stages.setdefault(name, {})
+        stage[measure] = stage.get(measure, 0) + value
+
+    def seconds(self, name: str) -> float:
+        return self._stages.get(name, {}).get('seconds', 0.)
+
+    def as_dict(self) -> Stages:
+        return {name: dict(measures) for name, measures in self._stages.items()}
+
+
+def path_size(path: Union[str, pathlib.Path]) -> int:
+    """Bytes of a file, or of the files inside a directory. """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
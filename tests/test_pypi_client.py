@@ -0,0 +1,78 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+import src.data.metadata_cache as mc
+import src.data.pypi_client as pc
+
+
+METADATA = {
+    'info': {'name': 'PyYAML', 'version': '6.0'},
+    'urls': [{
+        'packagetype': 'sdist',
+        'python_version': 'source',
+        'filename': 'PyYAML-6.0.tar.gz',
+        'url': 'https://files.pythonhosted.org/PyYAML-6.0.tar.gz',
+        'digests': {'sha256': 'abc'},
+        'size': 124996
+    }],
+    'releases': {}
+}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Answers /pypi/PyYAML/json, redirecting the non canonical names like PyPI. """
+    def do_GET(self):
+        if self.path == '/pypi/PyYAML/json':
+            body = json.dumps(METADATA).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/pypi/pyyaml/json':
+            self.send_response(301)
+            self.send_header('Location', '/pypi/PyYAML/json')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/pypi/loop/json':
+            self.send_response(302)
+            # Absolute, like the ones of PyPI.
+            location = 'http://%s:%d/pypi/loop/json' % self.server.server_address
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://%s:%d/pypi' % server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_latest_releases_follow_redirects(base_url, tmp_path):
+    cache = mc.MetadataCache(tmp_path / 'metadata.sqlite')
+    releases = pc.get_latest_releases(
+        ['pyyaml', 'PyYAML', 'missing'], base_url=base_url, cache=cache, retries=0
+    )
+    assert releases['pyyaml'] == releases['PyYAML'] == ('6.0', 'abc')
+    assert releases['missing'] is None
+    # Cached under the name requested.
+    assert cache.get('pyyaml').metadata['info']['name'] == 'PyYAML'
+
+
+def test_redirect_loop(base_url, tmp_path):
+    cache = mc.MetadataCache(tmp_path / 'metadata.sqlite')
+    releases = pc.get_latest_releases(['loop'], base_url=base_url, cache=cache)
+    assert releases == {'loop': None}